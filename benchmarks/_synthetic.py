@@ -0,0 +1,96 @@
+"""
+A throwaway copy of ppb_mutant with a generated asset index.
+
+Lets the benchmarks run offline, without the real emoji, against a catalogue
+of whatever size they like. Only the index files are generated, so images
+load as ppb's placeholders.
+"""
+import atexit
+import importlib.util
+import pathlib
+import shutil
+import sys
+import tempfile
+
+ROOT = pathlib.Path(__file__).absolute().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import download_zips  # noqa: E402
+
+# Things the package itself and the demos ask for by name
+BUILTIN = ['thinking', 'cross', 'tick', 'no_entry']
+VARIANT_BASES = ['hand', 'raising_hand']
+
+
+def emoji_names(plain, aliased):
+    """
+    Shortcodes for a catalogue of the given size, shaped like the real one.
+    """
+    yield from BUILTIN
+    for num in range(plain):
+        yield f"plain{num}"
+    for tone in download_zips.real_tones:
+        yield f"color_modifier_{tone}"
+    bases = VARIANT_BASES + [f"variant{num}" for num in range(aliased)]
+    for morph in download_zips.MORPHS:
+        for base in bases:
+            yield f"{base}_{morph}"
+        tones = [t for t in download_zips.TONES_ALL if t is not None]
+        tones += {
+            'hmn': download_zips.TONES_HMN,
+            'paw': download_zips.TONES_PAW,
+            'clw': download_zips.TONES_CLW,
+            'hoof': download_zips.TONES_HOOF,
+        }[morph]
+        for tone in tones:
+            for base in bases:
+                yield f"{base}_{morph}_{tone}"
+
+
+def build(root, *, plain=2000, aliased=40, compiled=True):
+    """
+    Writes a copy of ppb_mutant under root, with a synthetic index.
+    """
+    package = root / 'ppb_mutant'
+    shutil.copytree(
+        ROOT / 'ppb_mutant', package,
+        ignore=shutil.ignore_patterns('_assets', '__pycache__'),
+    )
+    assets = package / '_assets'
+    assets.mkdir()
+    (assets / '__init__.py').touch()
+
+    aliases = download_zips.AliasCompiler()
+    for name in emoji_names(plain, aliased):
+        aliases.add_path(f"synthetic/{name}.png")
+    with open(assets / 'index.txt', 'wt', encoding='utf-8') as indexfile:
+        aliases.write_code_index(indexfile)
+    with open(assets / 'aliases.txt', 'wt', encoding='utf-8') as indexfile:
+        aliases.write_alias_index(indexfile)
+
+    if compiled:
+        # The copy's own writer, loaded by path so ppb_mutant isn't imported yet
+        spec = importlib.util.spec_from_file_location('_synthetic_binindex', package / '_binindex.py')
+        binindex = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(binindex)
+        writer = binindex.IndexWriter()
+        writer.read_text_indexes(assets)
+        with open(assets / 'index.bin', 'wb') as indexfile:
+            writer.write(indexfile)
+    return package
+
+
+def install(**kwargs):
+    """
+    Builds a synthetic ppb_mutant in a temporary directory and puts it first
+    on sys.path. Call before importing ppb_mutant.
+
+    Returns the package directory.
+    """
+    if 'ppb_mutant' in sys.modules:
+        raise RuntimeError("ppb_mutant was already imported")
+    root = pathlib.Path(tempfile.mkdtemp(prefix='ppb_mutant-bench-'))
+    atexit.register(shutil.rmtree, root, True)
+    package = build(root, **kwargs)
+    sys.path.insert(0, str(root))
+    return package
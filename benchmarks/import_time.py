@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Measure how long `import ppb_mutant` takes, and fail if it's over budget.
+
+Each sample is a fresh interpreter, so nothing is cached between runs.
+"""
+import argparse
+import json
+import pathlib
+import statistics
+import subprocess
+import sys
+
+ROOT = pathlib.Path(__file__).absolute().parent.parent
+
+SCENARIOS = {
+    # Just the package: constants and the license notice
+    'import': "import ppb_mutant",
+    # What headless tools do: names and the index, but no ppb
+    'index': "import ppb_mutant; ppb_mutant.load_index(); ppb_mutant.lookup_alias('hand')",
+    # What games do
+    'emoji': "import ppb_mutant; ppb_mutant.Emoji",
+}
+
+TIMER = """
+import time, sys
+start = time.perf_counter()
+{code}
+end = time.perf_counter()
+if {headless}:
+    assert 'ppb' not in sys.modules, "ppb was imported"
+print(end - start, file=sys.stderr)
+"""
+
+
+def sample(code, headless):
+    proc = subprocess.run(
+        [sys.executable, '-c', TIMER.format(code=code, headless=headless)],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        universal_newlines=True, check=True,
+    )
+    return float(proc.stderr.strip().splitlines()[-1])
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=20, help='Samples per scenario (default: %(default)s)')
+    parser.add_argument(
+        '--budget-ms', type=float, default=50.0,
+        help='Maximum median time for the import scenario (default: %(default)s)',
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    results = {}
+    for name, code in SCENARIOS.items():
+        headless = name != 'emoji'
+        times = [sample(code, headless) * 1000 for _ in range(args.runs)]
+        results[name] = {
+            'median_ms': statistics.median(times),
+            'min_ms': min(times),
+            'max_ms': max(times),
+            'runs': args.runs,
+        }
+    results['budget_ms'] = args.budget_ms
+    print(json.dumps(results, indent=2))
+    if results['import']['median_ms'] > args.budget_ms:
+        sys.exit(f"import ppb_mutant took {results['import']['median_ms']:.1f}ms, over the {args.budget_ms}ms budget")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks for the ppb_mutant hot paths.
+
+Runs offline against a synthetic index (see _synthetic.py) and prints JSON, so
+runs can be saved and compared between releases.
+"""
+import argparse
+import itertools
+import json
+import platform
+import statistics
+import sys
+import time
+
+import _synthetic
+
+BENCHMARKS = {}
+
+
+def benchmark(number):
+    """
+    Registers a benchmark. The function takes no arguments and returns the
+    callable to time, which is called number times per sample.
+    """
+    def register(func):
+        BENCHMARKS[func.__name__] = func, number
+        return func
+    return register
+
+
+def measure(setup, number, repeat):
+    samples = []
+    for _ in range(repeat):
+        func = setup()
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - start) / number)
+    return {
+        'number': number,
+        'repeat': repeat,
+        'min_us': min(samples) * 1e6,
+        'median_us': statistics.median(samples) * 1e6,
+        'max_us': max(samples) * 1e6,
+    }
+
+
+def _cold(*funcs):
+    def run():
+        import ppb_mutant._data as data
+        for cached in (data.load_compiled_index, data._index_tables, *funcs):
+            cached.cache_clear()
+        funcs[0]()
+    return run
+
+
+@benchmark(number=20)
+def load_index_cold():
+    import ppb_mutant._data as data
+    return _cold(data.load_index)
+
+
+@benchmark(number=20)
+def load_index_cold_text():
+    import ppb_mutant._data as data
+    compiled = PACKAGE / '_assets' / 'index.bin'
+    hidden = compiled.with_suffix('.hidden')
+
+    def run():
+        compiled.rename(hidden)
+        try:
+            _cold(data.load_index)()
+        finally:
+            hidden.rename(compiled)
+            data.load_compiled_index.cache_clear()
+    return run
+
+
+@benchmark(number=100000)
+def load_index_warm():
+    import ppb_mutant
+    ppb_mutant.load_index()
+    return ppb_mutant.load_index
+
+
+@benchmark(number=100)
+def load_aliases_cold():
+    import ppb_mutant._data as data
+    return _cold(data.load_aliases)
+
+
+@benchmark(number=100000)
+def load_aliases_warm():
+    import ppb_mutant
+    ppb_mutant.load_aliases()
+    return ppb_mutant.load_aliases
+
+
+@benchmark(number=100)
+def has_variant_cold():
+    # The first Emoji() validates against the index
+    import ppb_mutant._data as data
+
+    def run():
+        for cached in (data.load_compiled_index, data._index_tables, data.load_index, data._has_index, data.has_variant):
+            cached.cache_clear()
+        data.has_variant('hand', 'paw', 'r1')
+    return run
+
+
+def _variants():
+    import ppb_mutant
+    return [
+        (shortcode, morph, tone)
+        for shortcode in ['hand', 'raising_hand', 'variant0', 'plain0', 'thinking']
+        for morph in ppb_mutant.MORPHS
+        for tone in ppb_mutant.TONES_ALL
+    ]
+
+
+@benchmark(number=10000)
+def resolve_name_uncached():
+    import ppb_mutant._data as data
+    requests = itertools.cycle(_variants())
+    resolve = data._resolve_name.__wrapped__
+
+    def run():
+        data._resolve_stem.cache_clear()
+        resolve(*next(requests))
+    return run
+
+
+@benchmark(number=100000)
+def resolve_name_cached():
+    import ppb_mutant._data as data
+    requests = itertools.cycle(_variants())
+    return lambda: data._resolve_name(*next(requests))
+
+
+@benchmark(number=20000)
+def emoji_construct():
+    import ppb_mutant
+    requests = itertools.cycle(_variants())
+
+    def run():
+        shortcode, morph, tone = next(requests)
+        ppb_mutant.Emoji(shortcode, morph=morph, tone=tone)
+    return run
+
+
+def _retone(count):
+    import ppb_mutant
+    shortcodes = [f"variant{num}" for num in range(40)] + [f"plain{num}" for num in range(count - 40)]
+    group = ppb_mutant.MorphToneGroup()
+    proxies = [group(shortcode) for shortcode in shortcodes]
+    tones = itertools.cycle(['r1', 'g2', 'b3'])
+
+    def run():
+        proxies  # Keep them alive
+        group.tone = next(tones)
+    return run
+
+
+@benchmark(number=200)
+def group_retone_100():
+    return _retone(100)
+
+
+@benchmark(number=20)
+def group_retone_1000():
+    return _retone(1000)
+
+
+@benchmark(number=20)
+def select_scene_construct():
+    import ppb_mutant
+    return ppb_mutant.SelectScene
+
+
+@benchmark(number=20)
+def index_compile_emojis():
+    from ppb_mutant.index import IndexScene
+    scene = IndexScene.__new__(IndexScene)
+    return scene.compile_emojis
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('names', nargs='*', help='Benchmarks to run (default: all)')
+    parser.add_argument('--repeat', type=int, default=5, help='Samples per benchmark (default: %(default)s)')
+    parser.add_argument('--plain', type=int, default=2000, help='Plain emoji in the synthetic index (default: %(default)s)')
+    parser.add_argument('--aliased', type=int, default=40, help='Customizable emoji in the synthetic index (default: %(default)s)')
+    parser.add_argument('--output', type=argparse.FileType('wt'), default=sys.stdout)
+    return parser.parse_args()
+
+
+def main():
+    global PACKAGE
+    args = parse_args()
+    PACKAGE = _synthetic.install(plain=args.plain, aliased=args.aliased)
+
+    import ppb_mutant
+    results = {}
+    for name in args.names or BENCHMARKS:
+        setup, number = BENCHMARKS[name]
+        try:
+            results[name] = measure(setup, number, args.repeat)
+        except Exception as exc:
+            # Some need a working ppb; report it and carry on
+            results[name] = {'error': f"{type(exc).__name__}: {exc}"}
+
+    json.dump({
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'index_size': len(ppb_mutant.load_index()),
+        'results': results,
+    }, args.output, indent=2)
+    args.output.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Frame-time benchmarks for the demo scenes, run headless.
+
+Drives IndexScene and SelectScene/CustomizeScene for a number of frames, with
+scripted mouse motion and clicks and a renderer that only loads each sprite's
+image, against a synthetic index (see _synthetic.py). Prints JSON: scene
+construction time, frame time percentiles, event dispatch cost and peak
+memory.
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import math
+import platform
+import resource
+import statistics
+import sys
+import time
+import tracemalloc
+
+import _synthetic
+
+SCENARIOS = {}
+
+
+def scenario(func):
+    """
+    Registers a scenario. The function takes no arguments and returns
+    (scene class, kwargs, clickable tags).
+    """
+    SCENARIOS[func.__name__] = func
+    return func
+
+
+@scenario
+def index():
+    from ppb_mutant.index import IndexScene
+    return IndexScene, {}, ('emoji',)
+
+
+@scenario
+def index_unvirtualized():
+    from ppb_mutant.index import IndexScene
+
+    class FullIndexScene(IndexScene):
+        virtual = False
+    return FullIndexScene, {}, ('emoji',)
+
+
+@scenario
+def select():
+    import ppb_mutant
+    return ppb_mutant.SelectScene, {}, ('morph', 'tone')
+
+
+@scenario
+def customize():
+    import ppb_mutant
+    from ppb_mutant.index import CustomizeScene
+    return CustomizeScene, {'mtg': ppb_mutant.MorphToneGroup()}, ('morph', 'tone')
+
+
+class Dispatcher:
+    """
+    Sends events to a scene and its children the way ppb's engine does,
+    keeping count of handler calls and the time they take.
+    """
+    def __init__(self, scene):
+        self.scene = scene
+        self.calls = 0
+        self.seconds = 0.0
+        self.queue = []
+
+    def signal(self, event):
+        # Scene changes and the like aren't followed; the scene keeps running
+        self.queue.append(event)
+
+    def send(self, event, name):
+        event.scene = self.scene
+        start = time.perf_counter()
+        for entity in itertools.chain((self.scene,), list(self.scene)):
+            handler = getattr(entity, f"on_{name}", None)
+            if handler is not None:
+                handler(event, self.signal)
+                self.calls += 1
+        self.seconds += time.perf_counter() - start
+
+
+def render(scene):
+    """
+    Loads the image of every sprite in the scene, as a renderer would before
+    drawing.
+    """
+    for sprite in scene:
+        image = getattr(sprite, 'image', None)
+        if hasattr(image, 'load'):
+            image.load()
+
+
+def _sweep(scene, frames):
+    """
+    Mouse positions for every frame, sweeping back and forth across the
+    camera's frame.
+    """
+    cam = scene.main_camera
+    left, right = cam.frame_left, cam.frame_right
+    bottom, top = cam.frame_bottom, cam.frame_top
+    for frame in range(frames):
+        sweep = (math.sin(frame / 20) + 1) / 2
+        yield frame, (left + (right - left) * sweep, bottom + (top - bottom) * (1 - sweep))
+
+
+@contextlib.contextmanager
+def asset_loading():
+    """
+    Runs ppb's asset loading, then sets up a fresh executor for the next
+    scenario like ppb's AssetLoadingSystem does between runs.
+    """
+    import ppb.assetlib as assetlib
+    try:
+        with assetlib._executor:
+            yield
+    finally:
+        assetlib._executor = assetlib.DelayedThreadExecutor()
+
+
+@contextlib.contextmanager
+def tracing():
+    tracemalloc.start()
+    try:
+        yield
+    finally:
+        tracemalloc.stop()
+
+
+def run(name, frames, click_every):
+    import ppb
+    from ppb import events
+
+    scene_class, kwargs, tags = SCENARIOS[name]()
+    with tracing(), asset_loading(), contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        scene = scene_class(**kwargs)
+        construct = time.perf_counter() - start
+
+        dispatcher = Dispatcher(scene)
+        # Click the clickable sprites, round robin
+        clickable = {sprite for tag in tags for sprite in scene.get(tag=tag)}
+        targets = itertools.cycle([sprite for sprite in scene if sprite in clickable] or [None])
+        times = []
+        for frame, (x, y) in _sweep(scene, frames):
+            start = time.perf_counter()
+            position = ppb.Vector(x, y)
+            dispatcher.send(events.MouseMotion(position=position, screen_position=position, delta=ppb.Vector(0, 0), buttons=()), 'mouse_motion')
+            if click_every and frame % click_every == 0:
+                target = next(targets)
+                if target is not None:
+                    dispatcher.send(events.ButtonPressed(button=ppb.buttons.Primary, position=target.position), 'button_pressed')
+            dispatcher.send(events.Update(time_delta=1 / 60), 'update')
+            dispatcher.send(events.PreRender(), 'pre_render')
+            render(scene)
+            times.append(time.perf_counter() - start)
+        _, peak = tracemalloc.get_traced_memory()
+
+    times.sort()
+    return {
+        'frames': frames,
+        'sprites': len(list(scene)),
+        'construct_ms': construct * 1e3,
+        'frame_ms': {
+            'p50': statistics.median(times) * 1e3,
+            'p90': times[int(len(times) * 0.9)] * 1e3,
+            'p99': times[int(len(times) * 0.99)] * 1e3,
+            'max': times[-1] * 1e3,
+        },
+        'dispatch': {
+            'handler_calls': dispatcher.calls,
+            'us_per_call': dispatcher.seconds / max(dispatcher.calls, 1) * 1e6,
+            'ms_per_frame': dispatcher.seconds / frames * 1e3,
+        },
+        'peak_python_kib': peak / 1024,
+        # Includes SDL surfaces, but never goes down, so it covers every
+        # scenario run so far
+        'max_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('names', nargs='*', help='Scenarios to run (default: all)')
+    parser.add_argument('--frames', type=int, default=600, help='Frames per scenario (default: %(default)s)')
+    parser.add_argument('--click-every', type=int, default=30, metavar='N', help='Click something every N frames, 0 to never (default: %(default)s)')
+    parser.add_argument('--plain', type=int, default=2000, help='Plain emoji in the synthetic index (default: %(default)s)')
+    parser.add_argument('--aliased', type=int, default=40, help='Customizable emoji in the synthetic index (default: %(default)s)')
+    parser.add_argument('--output', type=argparse.FileType('wt'), default=sys.stdout)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    _synthetic.install(plain=args.plain, aliased=args.aliased)
+
+    import ppb_mutant
+    results = {}
+    for name in args.names or SCENARIOS:
+        try:
+            results[name] = run(name, args.frames, args.click_every)
+        except Exception as exc:
+            # Report scenes this ppb can't run and carry on
+            results[name] = {'error': f"{type(exc).__name__}: {exc}"}
+
+    json.dump({
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'index_size': len(ppb_mutant.load_index()),
+        'results': results,
+    }, args.output, indent=2)
+    args.output.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,27 @@
 #!/usr/bin/env python3
 import os
 import urllib.request
+import urllib.parse
 import zipfile
-import io
+import shutil
+import concurrent.futures
 import argparse
 import re
 import pathlib
 import contextlib
+import hashlib
+
+try:
+    from PIL import Image
+except ImportError:
+    # Only needed to build atlases
+    Image = None
+
+try:
+    import numpy
+except ImportError:
+    # Only needed to build palettes
+    numpy = None
 
 DOWNLOADS = [
     ('https://mutant.tech/dl/2020.04/mtnt_2020.04_short_png128.zip', 'mtnt_2020.04_short_png128/emoji/'),
@@ -33,6 +48,10 @@ TONES_HOOF = []
 
 TONES = TONES_ALL + TONES_HMN + TONES_PAW + TONES_CLW + TONES_HOOF
 
+ATLAS_PAGE_SIZE = 2048
+
+# Downscaled copies to make, in pixels. The originals are 128px.
+LEVELS = [16, 32, 64]
 
 
 @contextlib.contextmanager
@@ -49,13 +68,80 @@ def parse_args():
     parser = argparse.ArgumentParser(
         description='Download the Mutant Standard emoji to the source directory.',
     )
+    parser.add_argument(
+        '--atlas', action='store_true',
+        help='Also pack the emoji into atlas pages (requires Pillow)',
+    )
+    parser.add_argument(
+        '--levels', action='store_true',
+        help=f"Also make downscaled copies at {', '.join(map(str, LEVELS))}px (requires Pillow)",
+    )
+    parser.add_argument(
+        '--recolor', action='store_true',
+        help='Replace tone variants with palettes where possible (requires Pillow and NumPy)',
+    )
+    parser.add_argument(
+        '--pack', action='store_true',
+        help='Pack all the assets into a single assets.pack instead of loose files',
+    )
+    parser.add_argument(
+        '--mirror', metavar='DIR_OR_URL',
+        help='Fetch the zips from this directory (or file: URL) or base URL instead of mutant.tech',
+    )
+    parser.add_argument(
+        '--cache', metavar='DIR', type=pathlib.Path,
+        default=pathlib.Path(__file__).absolute().parent / '.zips',
+        help='Where to keep downloaded zips and extracted files between runs (default: %(default)s)',
+    )
 
     return parser.parse_args()
 
 
-def open_zip(url):
-    with urllib.request.urlopen(url) as resp:
-        return io.BytesIO(resp.read())
+CHUNK_SIZE = 1024 * 1024
+
+
+def mirror_url(url, mirror):
+    """
+    Where to actually get url from, given a --mirror.
+
+    Returns a local path for a local directory mirror, or a URL.
+    """
+    if mirror is None:
+        return url
+    filename = urllib.parse.urlsplit(url).path.rsplit('/', 1)[-1]
+    if '://' in mirror:
+        return mirror.rstrip('/') + '/' + filename
+    else:
+        return os.path.join(mirror, filename)
+
+
+def fetch_zip(url, cache):
+    """
+    Downloads url into the cache directory, streaming to disk.
+
+    A previous partial download is resumed if the server supports ranges. Local
+    paths are used in place. Returns the path to the zip.
+    """
+    if '://' not in url:
+        return pathlib.Path(url)
+
+    filename = urllib.parse.urlsplit(url).path.rsplit('/', 1)[-1]
+    target = cache / filename
+    if target.exists():
+        return target
+    partial = target.with_name(filename + '.part')
+
+    request = urllib.request.Request(url)
+    have = partial.stat().st_size if partial.exists() else 0
+    if have:
+        request.add_header('Range', f"bytes={have}-")
+    with urllib.request.urlopen(request) as resp:
+        # Anything but Partial Content means we got the whole thing again
+        mode = 'ab' if getattr(resp, 'status', None) == 206 else 'wb'
+        with open(partial, mode) as fo:
+            shutil.copyfileobj(resp, fo, CHUNK_SIZE)
+    partial.replace(target)
+    return target
 
 
 real_tones = [t for t in TONES if t is not None]
@@ -116,24 +202,458 @@ class AliasCompiler:
             print(f"{alias}\t{expansion}", file=stream)
 
 
-def extract_zip(fo, root):
+class Manifest:
+    """
+    What's been extracted to root, by content hash, so rebuilds only write
+    what changed and identical images are only stored once.
+
+    root is a staging directory that only the manifest changes, and that
+    install() copies into _assets, so later steps can delete files from
+    _assets (by packing or recoloring them) without the next build having to
+    extract them again.
+
+    Saved as manifest.tsv: filename, sha256, zip CRC and size of every
+    extracted file, including ones that weren't stored because they're
+    duplicates.
+    """
+    FILENAME = 'manifest.tsv'
+
+    def __init__(self, root):
+        self.root = root
+        self.old = {}  # filename: (sha256, crc, size)
+        self.files = {}
+        self.sources = {}  # filename: (ZipFile, ZipInfo), open until finish()
+        try:
+            with open(os.path.join(root, self.FILENAME), 'rt', encoding='utf-8') as manifestfile:
+                for line in manifestfile:
+                    line = line.rstrip('\n')
+                    if line:
+                        name, digest, crc, size = line.split('\t')
+                        self.old[name] = digest, int(crc), int(size)
+        except FileNotFoundError:
+            pass
+
+    def _stored(self, name, digest):
+        # Whether the content is on disk, here or under a name it duplicates
+        if os.path.exists(os.path.join(self.root, name)):
+            return True
+        # (Unless that file has already been replaced this build)
+        return any(
+            self.files.get(other, entry)[0] == digest and os.path.exists(os.path.join(self.root, other))
+            for other, entry in self.old.items()
+            if other != name and entry[0] == digest
+        )
+
+    def extract(self, zf, zi, name):
+        """
+        Extracts a zip member to name, unless the last build already did.
+
+        Call once per name per build, with the member that wins it (see
+        read_zip()); extracting over a name again would always rewrite it.
+        """
+        self.sources[name] = zf, zi
+        old = self.old.get(name)
+        unchanged = old is not None and old[1:] == (zi.CRC, zi.file_size)
+        if unchanged and self._stored(name, old[0]):
+            self.files[name] = old
+            return False
+        self._write(name, zf, zi)
+        return True
+
+    def _write(self, name, zf, zi):
+        with zf.open(zi) as sf:
+            data = sf.read()
+        with open(os.path.join(self.root, name), 'wb') as tf:
+            tf.write(data)
+        self.files[name] = hashlib.sha256(data).hexdigest(), zi.CRC, zi.file_size
+
+    def finish(self):
+        """
+        Deletes duplicates and files that are gone from the zips, and writes
+        duplicates.txt (shortcode, shortcode it's stored as) and the manifest.
+
+        Returns the duplicates, {filename: filename it's stored as}.
+        """
+        for name in self.old.keys() - self.files.keys():
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(self.root, name))
+
+        stored = {}  # sha256: filename
+        duplicates = {}
+        for name in sorted(self.files):
+            digest = self.files[name][0]
+            if digest in stored:
+                duplicates[name] = stored[digest]
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(os.path.join(self.root, name))
+            else:
+                stored[digest] = name
+                if not os.path.exists(os.path.join(self.root, name)):
+                    # Was a duplicate of something that changed since
+                    self._write(name, *self.sources[name])
+
+        with open(os.path.join(self.root, 'duplicates.txt'), 'wt', encoding='utf-8') as dupfile:
+            for name, original in duplicates.items():
+                if name.endswith('.png') and original.endswith('.png'):
+                    print(name[:-len('.png')], original[:-len('.png')], sep='\t', file=dupfile)
+        with open(os.path.join(self.root, self.FILENAME), 'wt', encoding='utf-8') as manifestfile:
+            for name, (digest, crc, size) in sorted(self.files.items()):
+                print(name, digest, crc, size, sep='\t', file=manifestfile)
+        return duplicates
+
+
+def read_zip(fo, root):
+    """
+    Finds the emoji under root in the zip.
+
+    Returns an AliasCompiler of what was in it, and {filename: (ZipFile,
+    ZipInfo)} of the members to extract.
+    """
     zf = zipfile.ZipFile(fo, 'r')
     aliases = AliasCompiler()
+    members = {}
     for zi in zf.infolist():
         if not zi.filename.startswith(root):
             continue
         if zi.filename == root:
             continue
-        print('\t' + zi.filename[len(root):])
-        target = os.path.join('_assets', os.path.basename(zi.filename))
         if not zi.is_dir():
-            with open(target, 'wb') as tf:
-                tf.write(zf.read(zi.filename))
+            members[os.path.basename(zi.filename)] = zf, zi
             aliases.add_path(zi.filename[len(root):])
-    with open("_assets/index.txt", 'at') as indexfile:
-        aliases.write_code_index(indexfile)
-    with open("_assets/aliases.txt", 'at') as indexfile:
-        aliases.write_alias_index(indexfile)
+    return aliases, members
+
+
+def write_indexes(compilers):
+    """
+    Writes index.txt and aliases.txt from the AliasCompilers of every zip,
+    sorted and without duplicates. Later zips win any clashes, like their
+    files do.
+
+    Returns the names of the files written.
+    """
+    codes = {}
+    aliases = {}
+    for compiler in compilers:
+        for code, path in compiler.codes.items():
+            codes[code] = path, compiler.code2alias.get(code) or ''
+        aliases.update(compiler.aliases)
+    with open("_assets/index.txt", 'wt', encoding='utf-8') as indexfile:
+        for code, (path, alias) in sorted(codes.items()):
+            print(f"{code}\t{path}\t{alias}", file=indexfile)
+    with open("_assets/aliases.txt", 'wt', encoding='utf-8') as indexfile:
+        for alias, expansion in sorted(aliases.items()):
+            print(f"{alias}\t{expansion}", file=indexfile)
+    return {'index.txt', 'aliases.txt'}
+
+
+def compile_index():
+    # Imported here, so importing this module (eg, for the benchmarks) doesn't
+    # import ppb_mutant
+    from ppb_mutant._binindex import IndexWriter
+    writer = IndexWriter()
+    writer.read_text_indexes('_assets')
+    with open('_assets/index.bin', 'wb') as indexfile:
+        writer.write(indexfile)
+    return {'index.bin'}
+
+
+class AtlasPacker:
+    """
+    Shelf-packs images into fixed-size atlas pages.
+
+    Writes atlas_N.png pages and atlas.txt, mapping asset names to
+    (page, x, y, width, height).
+    """
+    def __init__(self, size=ATLAS_PAGE_SIZE):
+        self.size = size
+        self.pages = []
+        self.regions = {}
+        self._x = self._y = self._shelf = 0
+
+    def _new_page(self):
+        self.pages.append(Image.new('RGBA', (self.size, self.size), (0, 0, 0, 0)))
+        self._x = self._y = self._shelf = 0
+
+    def add(self, name, image):
+        width, height = image.size
+        if not self.pages:
+            self._new_page()
+        if self._x + width > self.size:
+            self._x = 0
+            self._y += self._shelf
+            self._shelf = 0
+        if self._y + height > self.size:
+            self._new_page()
+        page = len(self.pages) - 1
+        self.pages[page].paste(image, (self._x, self._y))
+        self.regions[name] = page, self._x, self._y, width, height
+        self._x += width
+        self._shelf = max(self._shelf, height)
+
+    def write(self, root):
+        """
+        Writes the pages and atlas.txt into root, returning their names.
+        """
+        rv = {'atlas.txt'}
+        for num, page in enumerate(self.pages):
+            page.save(os.path.join(root, f"atlas_{num}.png"), optimize=True)
+            rv.add(f"atlas_{num}.png")
+        with open(os.path.join(root, 'atlas.txt'), 'wt', encoding='utf-8') as atlasfile:
+            for name, region in self.regions.items():
+                print(name, *region, sep='\t', file=atlasfile)
+        return rv
+
+
+def emoji_pngs():
+    """
+    The full-size emoji images in _assets, skipping generated files.
+    """
+    return sorted(
+        name for name in os.listdir('_assets')
+        if name.endswith('.png') and not name.startswith('atlas_') and '@' not in name
+    )
+
+
+def read_duplicates(root):
+    """
+    Reads duplicates.txt, {shortcode: shortcode of the file it's stored as}
+    """
+    rv = {}
+    with contextlib.suppress(FileNotFoundError):
+        with open(os.path.join(root, 'duplicates.txt'), 'rt', encoding='utf-8') as dupfile:
+            for line in dupfile:
+                line = line.rstrip('\n')
+                if line:
+                    code, original = line.split('\t')
+                    rv[code] = original
+    return rv
+
+
+def tone_variants(root):
+    """
+    Finds the base of every tone variant in the index.
+
+    Returns {base: {tone: variant}}, by the shortcodes their files are stored
+    as (see duplicates.txt), only where both files exist. A stored file is
+    only ever one variant, and never also a base, so deleting variants keeps
+    every base.
+    """
+    from ppb_mutant._binindex import IndexWriter
+    writer = IndexWriter()
+    writer.read_text_indexes(root)
+    duplicates = read_duplicates(root)
+    rv = {}
+    for code, (_, alias) in writer.codes.items():
+        if not alias or code == alias:
+            continue
+        bits = code[len(alias) + 1:].split('_')
+        if len(bits) == 2:
+            base, tone = f"{alias}_{bits[0]}", bits[1]
+        elif bits[0] not in MORPHS:
+            base, tone = alias, bits[0]
+        else:
+            continue
+        base = duplicates.get(base, base)
+        code = duplicates.get(code, code)
+        if code == base:
+            continue
+        if os.path.exists(os.path.join(root, f"{base}.png")) and os.path.exists(os.path.join(root, f"{code}.png")):
+            rv.setdefault(base, {})[tone] = code
+
+    taken = set()
+    for tones in rv.values():
+        for tone, code in list(tones.items()):
+            if code in rv or code in taken:
+                del tones[tone]
+            else:
+                taken.add(code)
+    return {base: tones for base, tones in rv.items() if tones}
+
+
+def _load_rgba(name):
+    with Image.open(os.path.join('_assets', f"{name}.png")) as image:
+        return numpy.asarray(image.convert('RGBA'))
+
+
+def _pack_rgb(pixels):
+    rgb = pixels[..., :3].astype(numpy.uint32)
+    return (rgb[..., 0] << 16) | (rgb[..., 1] << 8) | rgb[..., 2]
+
+
+def _apply_palette(base, palette):
+    # Same swap as ppb_mutant/_palette.py does at load time
+    keys = _pack_rgb(base)
+    rv = base.copy()
+    for src, dst in palette.items():
+        hits = keys == src
+        rv[hits, 0] = dst >> 16
+        rv[hits, 1] = (dst >> 8) & 0xFF
+        rv[hits, 2] = dst & 0xFF
+    return rv
+
+
+def build_palettes():
+    """
+    Learns each tone's palette from the variants, then deletes every variant
+    the palette reproduces exactly, listing it in recolor.txt instead.
+
+    Only full-size variants are deleted; their downscaled copies are kept.
+    """
+    if Image is None or numpy is None:
+        raise SystemExit("Pillow and NumPy are required to build palettes")
+    groups = tone_variants('_assets')
+
+    # Every base color -> every color it became, per tone
+    seen = {}
+    for base, tones in groups.items():
+        base_pixels = _load_rgba(base)
+        for tone, code in tones.items():
+            pixels = _load_rgba(code)
+            if pixels.shape != base_pixels.shape:
+                continue
+            opaque = (base_pixels[..., 3] > 0) & (pixels[..., 3] > 0)
+            pairs = numpy.unique(
+                (_pack_rgb(base_pixels[opaque]).astype(numpy.uint64) << 24)
+                | _pack_rgb(pixels[opaque])
+            )
+            colors = seen.setdefault(tone, {})
+            for pair in pairs.tolist():
+                colors.setdefault(pair >> 24, set()).add(pair & 0xFFFFFF)
+
+    # Colors that went more than one way can't be swapped
+    palettes = {
+        tone: {
+            src: dsts.pop()
+            for src, dsts in colors.items()
+            if len(dsts) == 1 and src not in dsts
+        }
+        for tone, colors in seen.items()
+    }
+
+    recolor = []
+    for base, tones in sorted(groups.items()):
+        base_pixels = _load_rgba(base)
+        for tone, code in sorted(tones.items()):
+            pixels = _load_rgba(code)
+            if pixels.shape != base_pixels.shape:
+                continue
+            made = _apply_palette(base_pixels, palettes[tone])
+            visible = pixels[..., 3] > 0
+            if (made[..., 3] == pixels[..., 3]).all() and (made[visible] == pixels[visible]).all():
+                recolor.append((code, base, tone))
+
+    for code, _, _ in recolor:
+        os.remove(os.path.join('_assets', f"{code}.png"))
+    with open('_assets/recolor.txt', 'wt', encoding='utf-8') as recolorfile:
+        for record in recolor:
+            print(*record, sep='\t', file=recolorfile)
+    with open('_assets/palettes.txt', 'wt', encoding='utf-8') as palettefile:
+        for tone, palette in sorted(palettes.items()):
+            for src, dst in sorted(palette.items()):
+                print(tone, f"{src:06x}", f"{dst:06x}", sep='\t', file=palettefile)
+    return {'recolor.txt', 'palettes.txt'}
+
+
+def build_levels():
+    if Image is None:
+        raise SystemExit("Pillow is required to build levels")
+    rv = {'levels.txt'}
+    for name in emoji_pngs():
+        stem, _ = os.path.splitext(name)
+        with Image.open(os.path.join('_assets', name)) as image:
+            image = image.convert('RGBA')
+            for level in LEVELS:
+                scaled = image.resize((level, level), Image.LANCZOS)
+                scaled.save(os.path.join('_assets', f"{stem}@{level}.png"), optimize=True)
+                rv.add(f"{stem}@{level}.png")
+    with open('_assets/levels.txt', 'wt', encoding='utf-8') as levelsfile:
+        for level in LEVELS:
+            print(level, file=levelsfile)
+    return rv
+
+
+def build_atlas():
+    if Image is None:
+        raise SystemExit("Pillow is required to build atlases")
+    packer = AtlasPacker()
+    names = emoji_pngs()
+    # Tallest first keeps the shelves tight
+    images = [(name, Image.open(os.path.join('_assets', name))) for name in names]
+    images.sort(key=lambda item: -item[1].size[1])
+    for name, image in images:
+        with image:
+            packer.add(os.path.splitext(name)[0], image.convert('RGBA'))
+    return packer.write('_assets')
+
+
+def build_pack():
+    """
+    Moves every asset file into _assets/assets.pack.
+    """
+    from ppb_mutant._pack import PackWriter
+    writer = PackWriter()
+    names = sorted(
+        name for name in os.listdir('_assets')
+        if not name.endswith('.py') and name != 'assets.pack'
+        and os.path.isfile(os.path.join('_assets', name))
+    )
+    for name in names:
+        with open(os.path.join('_assets', name), 'rb') as assetfile:
+            writer.add(name, assetfile.read())
+    with open('_assets/assets.pack', 'wb') as packfile:
+        writer.write(packfile)
+    for name in names:
+        os.remove(os.path.join('_assets', name))
+
+
+def write_build_id(files, args):
+    """
+    Writes build.txt, a hash of every extracted file (by content) and the
+    options that made the rest, so processes sharing decoded images can tell
+    builds apart.
+    """
+    digest = hashlib.sha256()
+    for name, (sha256, _, _) in sorted(files.items()):
+        digest.update(f"{name}\t{sha256}\n".encode('utf-8'))
+    options = dict(atlas=args.atlas, levels=args.levels and LEVELS, recolor=args.recolor, pack=args.pack)
+    digest.update(repr(sorted(options.items())).encode('utf-8'))
+    with open('_assets/build.txt', 'wt', encoding='utf-8') as buildfile:
+        print(digest.hexdigest(), file=buildfile)
+    return {'build.txt'}
+
+
+def install(src, dest, names):
+    """
+    Hard links (or copies, where it can't) each of names from src into dest,
+    unless it's already there.
+    """
+    for name in names:
+        source = os.path.join(src, name)
+        target = os.path.join(dest, name)
+        if os.path.exists(target):
+            if os.path.samefile(source, target):
+                continue
+            have, want = os.stat(target), os.stat(source)
+            if (have.st_size, have.st_mtime_ns) == (want.st_size, want.st_mtime_ns):
+                continue
+            os.remove(target)
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copy2(source, target)
+
+
+def prune(root, keep):
+    """
+    Deletes every file in root that isn't in keep (besides modules), such as
+    the outputs of options that are off this time, or atlas pages and levels
+    that aren't made any more.
+    """
+    for name in sorted(os.listdir(root)):
+        path = os.path.join(root, name)
+        if name not in keep and not name.endswith('.py') and os.path.isfile(path):
+            print(f"Removing {name}")
+            os.remove(path)
 
 
 def make_root():
@@ -145,12 +665,62 @@ def main():
     args = parse_args()
     rootdir = pathlib.Path(__file__).absolute().parent / 'ppb_mutant'
 
-    with enter_dir(rootdir):
+    # Relative to where we were run, not to rootdir
+    args.cache = args.cache.resolve()
+    if args.mirror is not None and args.mirror.startswith('file:'):
+        # A local directory either way, so use it in place like one
+        args.mirror = urllib.request.url2pathname(urllib.parse.urlsplit(args.mirror).path)
+    if args.mirror is not None and '://' not in args.mirror:
+        args.mirror = os.path.abspath(args.mirror)
+    args.cache.mkdir(parents=True, exist_ok=True)
+
+    with enter_dir(rootdir), concurrent.futures.ThreadPoolExecutor(len(DOWNLOADS)) as pool:
         make_root()
-        for url, root in DOWNLOADS:
-            print(url)
-            with open_zip(url) as fo:
-                extract_zip(fo, root)
+        # Download everything at once, but extract in order so that later
+        # archives still win any filename clashes.
+        zips = [
+            (url, root, pool.submit(fetch_zip, mirror_url(url, args.mirror), args.cache))
+            for url, root in DOWNLOADS
+        ]
+        staging = args.cache / 'extracted'
+        staging.mkdir(exist_ok=True)
+        manifest = Manifest(staging)
+        compilers = []
+        members = {}
+        with contextlib.ExitStack() as stack:
+            for url, root, download in zips:
+                print(url)
+                fo = stack.enter_context(open(download.result(), 'rb'))
+                aliases, found = read_zip(fo, root)
+                compilers.append(aliases)
+                members.update(found)
+            for name, (zf, zi) in members.items():
+                if manifest.extract(zf, zi, name):
+                    print('\t' + zi.filename)
+            duplicates = manifest.finish()
+        print(f"{len(duplicates)} duplicate files stored once")
+        extracted = {'duplicates.txt', *members.keys() - duplicates.keys()}
+        install(staging, '_assets', extracted)
+
+        # Everything this build makes; the rest is left over from earlier ones
+        outputs = set(extracted)
+        outputs |= write_indexes(compilers)
+        outputs |= compile_index()
+        # Levels are made from every full-size variant, before recoloring
+        # deletes some; palettes don't fit resampled images
+        if args.levels:
+            outputs |= build_levels()
+        if args.recolor:
+            outputs |= build_palettes()
+        if args.atlas:
+            outputs |= build_atlas()
+        outputs |= write_build_id(manifest.files, args)
+        if args.pack:
+            # Rewritten below
+            outputs.add('assets.pack')
+        prune('_assets', outputs)
+        if args.pack:
+            build_pack()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,169 @@
+"""
+Atlas support: emoji packed into shared pages by `download_zips.py --atlas`.
+
+Each emoji is cut out of its page instead of opening and decoding its own PNG.
+A page is decoded once and kept while emoji cut from it are loaded, and counted
+in texture_memory.
+"""
+import collections
+import functools
+import io
+import threading
+
+from sdl2 import (
+    rw_from_object, SDL_Rect, SDL_BlitSurface, SDL_CreateRGBSurfaceWithFormat,
+    SDL_FreeSurface, SDL_SetSurfaceBlendMode, SDL_BLENDMODE_NONE, SDL_BLENDMODE_BLEND,
+)
+from sdl2.sdlimage import IMG_Load_RW
+from ppb.systems.sdl_utils import sdl_call, img_call
+
+from ._data import ASSET_PREFIX, open_asset
+from ._memory import texture_memory
+
+_page_lock = threading.Lock()
+_pages = {}  # page: [surface, cuts not released yet]
+_idle_page = None  # Released, but kept in case the next emoji is on it too
+_released = collections.deque()  # From finalizers; see release_page_later()
+
+
+@functools.lru_cache()
+def load_atlas():
+    """
+    Loads the atlas region table, {asset name: (page, x, y, width, height)}
+    """
+    rv = {}
+    try:
+        with open_asset('atlas.txt', encoding='utf-8') as atlasfile:
+            for line in atlasfile:
+                line = line.rstrip('\n')
+                if not line:
+                    continue
+                name, *region = line.split('\t')
+                rv[f"{ASSET_PREFIX}{name}.png"] = tuple(int(n) for n in region)
+    except FileNotFoundError:
+        pass
+    return rv
+
+
+def lookup_region(name):
+    """
+    Returns the atlas region for the given asset name, or None if it isn't in
+    an atlas.
+    """
+    return load_atlas().get(name)
+
+
+def _decode_page(page):
+    with open_asset(f"atlas_{page}.png") as pagefile:
+        data = pagefile.read()
+    surface = img_call(
+        IMG_Load_RW, rw_from_object(io.BytesIO(data)), False,
+        _check_error=lambda rv: not rv
+    )
+    # Copy pixels out verbatim, alpha included
+    sdl_call(
+        SDL_SetSurfaceBlendMode, surface, SDL_BLENDMODE_NONE,
+        _check_error=lambda rv: rv < 0
+    )
+    return surface
+
+
+def _release(page):
+    # Called with _page_lock held. Returns the page to free, if any.
+    global _idle_page
+    entry = _pages[page]
+    entry[1] -= 1
+    if entry[1] or _idle_page == page:
+        return None
+    stale, _idle_page = _idle_page, page
+    return stale
+
+
+def _free(page):
+    # Called without _page_lock, since texture_memory may be unloading emoji
+    if page is None:
+        return
+    with _page_lock:
+        entry = _pages.get(page)
+        if entry is None or entry[1] or page == _idle_page:
+            return
+        del _pages[page]
+    SDL_FreeSurface(entry[0])
+    texture_memory.remove_other(('atlas', page))
+
+
+def _release_now(page):
+    with _page_lock:
+        stale = _release(page)
+    _free(stale)
+
+
+def _drain():
+    while True:
+        try:
+            page = _released.popleft()
+        except IndexError:
+            return
+        _release_now(page)
+
+
+def release_page(page):
+    """
+    Lets go of the page a cut_region() was made from, once that surface is
+    freed. A page nothing is cut from any more is freed when another page is
+    released.
+    """
+    _drain()
+    _release_now(page)
+
+
+def release_page_later(page):
+    """
+    Like release_page(), but safe to call from __del__, which the GC may run
+    while this thread holds the page lock. The page is released on the next
+    release_page() or cut_region().
+    """
+    _released.append(page)
+
+
+def cut_region(page, x, y, width, height):
+    """
+    Makes a new surface from a region of an atlas page.
+
+    The page is kept until release_page() is called for it, once per cut.
+
+    Called in the background thread.
+    """
+    global _idle_page
+    _drain()
+    with _page_lock:
+        entry = _pages.get(page)
+        decoded = entry is None
+        if decoded:
+            entry = _pages[page] = [_decode_page(page), 0]
+        entry[1] += 1
+        if _idle_page == page:
+            _idle_page = None
+        source = entry[0]
+    if decoded:
+        info = source.contents
+        texture_memory.add_other(('atlas', page), info.pitch * info.h)
+
+    try:
+        surface = sdl_call(
+            SDL_CreateRGBSurfaceWithFormat, 0, width, height, 32, source.contents.format.contents.format,
+            _check_error=lambda rv: not rv
+        )
+        with _page_lock:
+            sdl_call(
+                SDL_BlitSurface, source, SDL_Rect(x, y, width, height), surface, None,
+                _check_error=lambda rv: rv < 0
+            )
+    except BaseException:
+        release_page(page)
+        raise
+    sdl_call(
+        SDL_SetSurfaceBlendMode, surface, SDL_BLENDMODE_BLEND,
+        _check_error=lambda rv: rv < 0
+    )
+    return surface
@@ -0,0 +1,212 @@
+"""
+The compiled emoji index (index.bin): the reader, and the writer
+download_zips.py uses.
+
+The file is a set of fixed-width tables over a shared string blob, so it can be
+used straight out of a memory map without parsing:
+
+* header: MAGIC, then counts and table offsets (HEADER)
+* code records: (code, path, alias) as string refs (CODE_RECORD)
+* alias records: (alias, expansion) as string refs (ALIAS_RECORD)
+* three open-addressed hash tables (by code, by alias, by path) of uint32
+  record numbers, EMPTY for unused slots, probed linearly from crc32(key)
+* two listings, for reading every record at once: the code records as
+  code, path, alias (empty for None), and the alias records as alias,
+  expansion; each is every field, tab-separated, UTF-8
+* the string blob, UTF-8
+
+A string ref is (offset into blob, length); an alias ref with length 0 is None.
+"""
+import os
+import struct
+import zlib
+
+MAGIC = b'MTNTIDX2'
+HEADER = struct.Struct('<8s13I')
+CODE_RECORD = struct.Struct('<6I')
+ALIAS_RECORD = struct.Struct('<4I')
+SLOT = struct.Struct('<I')
+EMPTY = 0xFFFFFFFF
+
+
+def slot_of(key, capacity):
+    """
+    The first slot to probe for a key in a table of the given capacity (a power
+    of two).
+    """
+    return zlib.crc32(key.encode('utf-8')) & (capacity - 1)
+
+
+def build_table(keys):
+    """
+    Builds a hash table of the record numbers of keys, in order. Returns
+    (capacity, table as bytes).
+    """
+    capacity = 1
+    while capacity < len(keys) * 2:
+        capacity *= 2
+    slots = [EMPTY] * capacity
+    for num, key in enumerate(keys):
+        slot = slot_of(key, capacity)
+        while slots[slot] != EMPTY:
+            slot = (slot + 1) & (capacity - 1)
+        slots[slot] = num
+    return capacity, b''.join(SLOT.pack(s) for s in slots)
+
+
+class CompiledIndex:
+    """
+    Read-only view of a compiled index.
+
+    buf may be bytes or an mmap.
+    """
+    def __init__(self, buf):
+        (
+            magic, self._ncodes, self._naliases, self._codecap, self._aliascap,
+            self._codes_at, self._aliases_at, self._bycode_at, self._byalias_at,
+            self._bypath_at, self._codelist_at, self._codelist_len,
+            self._aliaslist_at, self._aliaslist_len,
+        ) = HEADER.unpack_from(buf, 0)
+        if magic != MAGIC:
+            raise ValueError(f"Not a compiled emoji index (magic {magic!r})")
+        self._buf = buf
+        self._strings_at = self._aliaslist_at + self._aliaslist_len
+
+    def __len__(self):
+        return self._ncodes
+
+    def _str(self, offset, length):
+        start = self._strings_at + offset
+        return bytes(self._buf[start:start + length]).decode('utf-8')
+
+    def _code(self, num):
+        co, cl, po, pl, ao, al = CODE_RECORD.unpack_from(
+            self._buf, self._codes_at + num * CODE_RECORD.size)
+        return self._str(co, cl), self._str(po, pl), (self._str(ao, al) if al else None)
+
+    def _alias(self, num):
+        ao, al, eo, el = ALIAS_RECORD.unpack_from(
+            self._buf, self._aliases_at + num * ALIAS_RECORD.size)
+        return self._str(ao, al), self._str(eo, el)
+
+    def _probe(self, table_at, capacity, key, keyof):
+        """
+        Finds the record number whose key (as given by keyof) is key, or None
+        """
+        if not capacity:
+            return None
+        slot = slot_of(key, capacity)
+        for _ in range(capacity):
+            num, = SLOT.unpack_from(self._buf, table_at + slot * SLOT.size)
+            if num == EMPTY:
+                return None
+            if keyof(num) == key:
+                return num
+            slot = (slot + 1) & (capacity - 1)
+        return None
+
+    def by_code(self, shortcode):
+        """
+        (shortcode, path, alias) for the given shortcode, or None
+        """
+        num = self._probe(self._bycode_at, self._codecap, shortcode, lambda n: self._code(n)[0])
+        return None if num is None else self._code(num)
+
+    def by_path(self, path):
+        """
+        (shortcode, path, alias) for the given original path, or None
+        """
+        num = self._probe(self._bypath_at, self._codecap, path, lambda n: self._code(n)[1])
+        return None if num is None else self._code(num)
+
+    def by_alias(self, alias):
+        """
+        The expansion template of the given alias, or None
+        """
+        num = self._probe(self._byalias_at, self._aliascap, alias, lambda n: self._alias(n)[0])
+        return None if num is None else self._alias(num)[1]
+
+    def _listing(self, offset, length, width):
+        if not length:
+            return []
+        fields = bytes(self._buf[offset:offset + length]).decode('utf-8').split('\t')
+        return zip(*[iter(fields)] * width)
+
+    def codes(self):
+        """
+        Yields every (shortcode, path, alias), in build order
+        """
+        for code, path, alias in self._listing(self._codelist_at, self._codelist_len, 3):
+            yield code, path, alias or None
+
+    def aliases(self):
+        """
+        Yields every (alias, expansion), in build order
+        """
+        return self._listing(self._aliaslist_at, self._aliaslist_len, 2)
+
+
+class IndexWriter:
+    """
+    Writes a compiled index from the text indexes (see download_zips.py).
+    """
+    def __init__(self):
+        self.codes = {}
+        self.aliases = {}
+        self._blob = bytearray()
+        self._strings = {}
+
+    def read_text_indexes(self, root):
+        with open(os.path.join(root, 'index.txt'), 'rt', encoding='utf-8') as indexfile:
+            for line in indexfile:
+                line = line.rstrip('\n')
+                if line:
+                    code, path, alias = line.split('\t')
+                    self.codes[code] = path, alias
+        with open(os.path.join(root, 'aliases.txt'), 'rt', encoding='utf-8') as indexfile:
+            for line in indexfile:
+                line = line.strip()
+                if line:
+                    alias, expansion = line.split('\t')
+                    self.aliases[alias] = expansion
+
+    def _ref(self, text):
+        if text not in self._strings:
+            data = text.encode('utf-8')
+            self._strings[text] = len(self._blob), len(data)
+            self._blob += data
+        return self._strings[text]
+
+    def write(self, stream):
+        codes = b''.join(
+            CODE_RECORD.pack(*self._ref(code), *self._ref(path), *self._ref(alias))
+            for code, (path, alias) in self.codes.items()
+        )
+        aliases = b''.join(
+            ALIAS_RECORD.pack(*self._ref(alias), *self._ref(expansion))
+            for alias, expansion in self.aliases.items()
+        )
+        codecap, bycode = build_table(list(self.codes))
+        _, bypath = build_table([path for path, _ in self.codes.values()])
+        aliascap, byalias = build_table(list(self.aliases))
+        codelist = '\t'.join(
+            f"{code}\t{path}\t{alias}" for code, (path, alias) in self.codes.items()
+        ).encode('utf-8')
+        aliaslist = '\t'.join(
+            f"{alias}\t{expansion}" for alias, expansion in self.aliases.items()
+        ).encode('utf-8')
+
+        codes_at = HEADER.size
+        aliases_at = codes_at + len(codes)
+        bycode_at = aliases_at + len(aliases)
+        byalias_at = bycode_at + len(bycode)
+        bypath_at = byalias_at + len(byalias)
+        codelist_at = bypath_at + len(bypath)
+        aliaslist_at = codelist_at + len(codelist)
+        stream.write(HEADER.pack(
+            MAGIC, len(self.codes), len(self.aliases), codecap, aliascap,
+            codes_at, aliases_at, bycode_at, byalias_at, bypath_at,
+            codelist_at, len(codelist), aliaslist_at, len(aliaslist),
+        ))
+        for chunk in (codes, aliases, bycode, byalias, bypath, codelist, aliaslist, self._blob):
+            stream.write(chunk)
@@ -0,0 +1,90 @@
+"""
+The emoji catalogue: every emoji once, in a stable order, with search.
+"""
+import bisect
+import collections
+import functools
+
+from ._data import load_index
+
+#: Length of the n-grams used for substring search
+NGRAM = 3
+
+
+def _ngrams(text):
+    return {text[i:i + NGRAM] for i in range(len(text) - NGRAM + 1)}
+
+
+class Catalog:
+    """
+    Deduplicated emoji names (aliases, or shortcodes for emoji without one),
+    ordered by their original path like the index demo shows them.
+
+    Search is case-insensitive and matches against both the names and every
+    shortcode behind them, so `paw` finds `hand`. Results come back in
+    catalogue order.
+    """
+    def __init__(self, index):
+        names = {}
+        keys = collections.defaultdict(set)
+        for shortcode, _, alias in sorted(index, key=lambda record: record[1]):
+            name = alias or shortcode
+            num = names.setdefault(name, len(names))
+            keys[name.lower()].add(num)
+            keys[shortcode.lower()].add(num)
+
+        self.names = list(names)
+        self._keys = sorted(keys)
+        self._key_names = [sorted(keys[key]) for key in self._keys]
+        self._ngrams = collections.defaultdict(list)
+        for keynum, key in enumerate(self._keys):
+            for gram in _ngrams(key):
+                self._ngrams[gram].append(keynum)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __getitem__(self, item):
+        return self.names[item]
+
+    def _page(self, keynums, offset, limit):
+        nums = sorted({num for keynum in keynums for num in self._key_names[keynum]})
+        end = None if limit is None else offset + limit
+        return [self.names[num] for num in nums[offset:end]]
+
+    def prefix(self, text, *, offset=0, limit=None):
+        """
+        Names with a name or shortcode starting with text.
+        """
+        text = text.lower()
+        start = bisect.bisect_left(self._keys, text)
+        # Every string with this prefix sorts before text + the biggest character
+        end = bisect.bisect_left(self._keys, text + '\U0010ffff', start)
+        return self._page(range(start, end), offset, limit)
+
+    def search(self, text, *, offset=0, limit=None):
+        """
+        Names with a name or shortcode containing text.
+        """
+        text = text.lower()
+        if len(text) < NGRAM:
+            # Too short to narrow down by n-gram; there aren't many keys anyway
+            candidates = range(len(self._keys))
+        else:
+            postings = sorted((self._ngrams.get(gram, []) for gram in _ngrams(text)), key=len)
+            candidates = set(postings[0]).intersection(*postings[1:])
+        return self._page(
+            (keynum for keynum in candidates if text in self._keys[keynum]),
+            offset, limit,
+        )
+
+
+@functools.lru_cache()
+def load_catalog():
+    """
+    The Catalog of everything in the index, built once.
+    """
+    return Catalog(load_index())
@@ -0,0 +1,433 @@
+"""
+Emoji names: the index, aliases, and resolving names to asset paths.
+
+Doesn't import ppb, so headless tools can use it cheaply.
+"""
+import functools
+import hashlib
+import importlib
+import importlib.resources as impres
+import io
+import mmap
+import os
+
+from . import MORPHS, TONES_ALL, TONES_HMN, TONES_PAW, TONES_CLW, TONES_HOOF
+from . import stats
+from ._binindex import CompiledIndex
+from ._pack import PackedAssets
+
+ASSETS_PACKAGE = 'ppb_mutant._assets'
+#: Prefix of the asset names Emoji resolves to
+ASSET_PREFIX = 'ppb_mutant/_assets/'
+
+
+def _open_file(filename, encoding):
+    # This is what ppb.vfs does for package files, without having to import ppb.
+    if hasattr(impres, 'files'):  # 3.9
+        path = impres.files(ASSETS_PACKAGE) / filename
+        if encoding is None:
+            return path.open('rb')
+        else:
+            return path.open('rt', encoding=encoding)
+    elif encoding is None:
+        return impres.open_binary(ASSETS_PACKAGE, filename)
+    else:
+        return impres.open_text(ASSETS_PACKAGE, filename, encoding)
+
+
+@functools.lru_cache()
+def load_pack():
+    """
+    Loads the packed assets container (built by download_zips.py),
+    memory-mapped when possible.
+
+    Returns None if there isn't one, in which case assets are loose files.
+    """
+    try:
+        with _open_file('assets.pack', None) as packfile:
+            try:
+                buf = mmap.mmap(packfile.fileno(), 0, access=mmap.ACCESS_READ)
+            except (AttributeError, OSError, io.UnsupportedOperation):
+                # Not backed by a real file (eg, zipimport)
+                buf = packfile.read()
+    except FileNotFoundError:
+        return None
+    return PackedAssets(buf)
+
+
+def open_asset(filename, *, encoding=None):
+    """
+    Opens a file from the assets package, out of the packed container if there
+    is one.
+    """
+    pack = load_pack()
+    data = None if pack is None else pack.get(filename)
+    if data is None:
+        return _open_file(filename, encoding)
+    elif encoding is None:
+        return io.BytesIO(data)
+    else:
+        return io.TextIOWrapper(io.BytesIO(data), encoding=encoding)
+
+
+def packed_asset(name):
+    """
+    The contents of an asset (by its full asset name, as Emoji uses) straight
+    out of the packed container, or None if it isn't packed.
+    """
+    pack = load_pack()
+    if pack is None or not name.startswith(ASSET_PREFIX):
+        return None
+    return pack.get(name[len(ASSET_PREFIX):])
+
+
+@functools.lru_cache()
+def build_id():
+    """
+    A string identifying this build of the assets (written by
+    download_zips.py), which changes whenever any image might have.
+
+    For assets built before build.txt, a hash of the asset files' names,
+    sizes and modification times.
+    """
+    try:
+        with open_asset('build.txt', encoding='utf-8') as buildfile:
+            return buildfile.read().strip()
+    except FileNotFoundError:
+        pass
+    digest = hashlib.sha256()
+    try:
+        root = os.path.dirname(importlib.import_module(ASSETS_PACKAGE).__file__)
+        entries = sorted(os.scandir(root), key=lambda entry: entry.name)
+    except OSError:
+        # Not real files (eg, zipimport); nothing to go by
+        return 'unknown'
+    for entry in entries:
+        if entry.is_file():
+            info = entry.stat()
+            digest.update(f"{entry.name}\t{info.st_size}\t{info.st_mtime_ns}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+@functools.lru_cache()
+@stats.timed('load_compiled_index')
+def load_compiled_index():
+    """
+    Loads the compiled index (built by download_zips.py), memory-mapped when
+    possible.
+
+    Returns None if there isn't one (or it's an older format), in which case
+    the text indexes are used.
+    """
+    pack = load_pack()
+    if pack is not None and 'index.bin' in pack:
+        buf = pack.get('index.bin')
+    else:
+        try:
+            with _open_file('index.bin', None) as indexfile:
+                try:
+                    buf = mmap.mmap(indexfile.fileno(), 0, access=mmap.ACCESS_READ)
+                except (AttributeError, OSError, io.UnsupportedOperation):
+                    # Not backed by a real file (eg, zipimport)
+                    buf = indexfile.read()
+        except FileNotFoundError:
+            return None
+    try:
+        return CompiledIndex(buf)
+    except ValueError:
+        # Written by an older download_zips.py; the text indexes still work
+        return None
+
+
+@functools.lru_cache()
+@stats.timed('load_index')
+def load_index():
+    """
+    Loads the index file, yielding (shortcode, original path, alias)
+    """
+    compiled = load_compiled_index()
+    if compiled is not None:
+        return list(compiled.codes())
+
+    rv = []
+    try:
+        with open_asset('index.txt', encoding='utf-8') as indexfile:
+            for line in indexfile:
+                line = line.rstrip('\n')
+                if not line:
+                    continue
+                bits = line.split('\t')
+                code, path, alias = bits
+                rv.append((code, path, alias or None))
+    except FileNotFoundError:
+        pass
+    return rv
+
+
+@functools.lru_cache()
+@stats.timed('load_aliases')
+def load_aliases():
+    """
+    Loads the aliases file, yielding (alias, expansion)
+    """
+    compiled = load_compiled_index()
+    if compiled is not None:
+        return dict(compiled.aliases())
+
+    rv = {}
+    try:
+        with open_asset('aliases.txt', encoding='utf-8') as indexfile:
+            for line in indexfile:
+                line = line.strip()
+                if not line:
+                    continue
+                bits = line.split('\t')
+                alias, expansion = bits
+                rv[alias] = expansion
+    except FileNotFoundError:
+        pass
+    return rv
+
+
+@functools.lru_cache()
+def load_duplicates():
+    """
+    Loads the duplicates table (built by download_zips.py), {shortcode:
+    shortcode of the identical image it's stored as}.
+    """
+    rv = {}
+    try:
+        with open_asset('duplicates.txt', encoding='utf-8') as dupfile:
+            for line in dupfile:
+                line = line.rstrip('\n')
+                if line:
+                    code, original = line.split('\t')
+                    rv[code] = original
+    except FileNotFoundError:
+        pass
+    return rv
+
+
+@functools.lru_cache()
+def _index_tables():
+    """
+    Lookup tables over the text index, for when there's no compiled index.
+    """
+    bycode = {}
+    bypath = {}
+    for record in load_index():
+        bycode[record[0]] = record
+        bypath[record[1]] = record
+    return bycode, bypath
+
+
+@functools.lru_cache()
+def _has_index():
+    """
+    Whether there's an index to check names against, without loading all of
+    it.
+    """
+    compiled = load_compiled_index()
+    if compiled is not None:
+        return len(compiled) > 0
+    return bool(_index_tables()[0])
+
+
+def lookup_shortcode(shortcode):
+    """
+    Finds (shortcode, original path, alias) by shortcode, or None.
+    """
+    compiled = load_compiled_index()
+    if compiled is not None:
+        return compiled.by_code(shortcode)
+    return _index_tables()[0].get(shortcode)
+
+
+def lookup_path(path):
+    """
+    Finds (shortcode, original path, alias) by original path, or None.
+    """
+    compiled = load_compiled_index()
+    if compiled is not None:
+        return compiled.by_path(path)
+    return _index_tables()[1].get(path)
+
+
+def lookup_alias(alias):
+    """
+    Finds the expansion of an alias, or None.
+    """
+    compiled = load_compiled_index()
+    if compiled is not None:
+        return compiled.by_alias(alias)
+    return load_aliases().get(alias)
+
+
+def is_valid_morph_tone(morph, tone):
+    """
+    Returns True if this is a valid morph, a valid tone, and they are valid
+    together.
+    """
+    if morph not in MORPHS:
+        return False
+    if tone in TONES_ALL:
+        return True
+    if morph == 'hmn' and tone in TONES_HMN:
+        return True
+    if morph == 'paw' and tone in TONES_PAW:
+        return True
+    if morph == 'clw' and tone in TONES_CLW:
+        return True
+    if morph == 'hoof' and tone in TONES_HOOF:
+        return True
+
+    # Fall through
+    return False
+
+
+@functools.lru_cache(maxsize=4096)
+def _resolve_stem(shortcode, morph, tone):
+    """
+    Resolves a (shortcode, morph, tone) to the shortcode of the actual asset.
+    """
+    if shortcode == 'color_modifier' and tone is None:
+        # color_modifier doesn't ship with a None tone, but None == k2
+        tone = 'k2'
+    elif shortcode == 'hand_splayed' and morph == 'paw':
+        # paw's :hand: is already splayed
+        shortcode = 'hand'
+    resolved = lookup_alias(shortcode) or shortcode
+    resolved = resolved.format(morph=morph, tone=tone or '')
+    return resolved.rstrip('_')
+
+
+@functools.lru_cache(maxsize=4096)
+def _resolve_name(shortcode, morph, tone, level=None):
+    """
+    Resolves a (shortcode, morph, tone, level) to its asset path.
+
+    Memoized, so repeated requests for a variant are a single lookup.
+    """
+    resolved = _resolve_stem(shortcode, morph, tone)
+    if level is not None:
+        resolved = f"{resolved}@{level}"
+    return f"{ASSET_PREFIX}{resolved}.png"
+
+
+@functools.lru_cache(maxsize=4096)
+def stored_name(name):
+    """
+    The asset name an asset's image is actually stored under, which differs
+    from its own if it's identical to another (see load_duplicates()).
+    """
+    if not name.startswith(ASSET_PREFIX) or not name.endswith('.png'):
+        return name
+    stem, at, level = name[len(ASSET_PREFIX):-len('.png')].partition('@')
+    original = load_duplicates().get(stem)
+    if original is None:
+        return name
+    return f"{ASSET_PREFIX}{original}{at}{level}.png"
+
+
+@functools.lru_cache(maxsize=4096)
+def has_variant(shortcode, morph='hmn', tone=None):
+    """
+    Returns True if the index has an asset for this shortcode/alias with this
+    morph and tone.
+
+    Always True if there's no index to check against.
+    """
+    if not _has_index():
+        return True
+    return lookup_shortcode(_resolve_stem(shortcode, morph, tone)) is not None
+
+
+def _split_variant(suffix):
+    """
+    Splits the morph/tone off the end of a shortcode, as download_zips.py's
+    AliasCompiler does when guessing aliases.
+    """
+    bits = suffix.split('_')
+    if len(bits) == 2:
+        return tuple(bits)
+    elif bits[0] in MORPHS:
+        return bits[0], None
+    else:
+        return None, bits[0]
+
+
+@functools.lru_cache()
+def load_variants():
+    """
+    Works out which variants exist for every emoji in the index.
+
+    Returns {alias or shortcode: {(morph, tone), ...}}. A morph of None means
+    the emoji only varies by tone, so any morph works; (None, None) is a plain
+    emoji with no variants.
+    """
+    rv = {}
+    for code, _, alias in load_index():
+        if alias is None or code == alias:
+            rv.setdefault(code, set()).add((None, None))
+        else:
+            rv.setdefault(alias, set()).add(_split_variant(code[len(alias) + 1:]))
+
+    # Mirror the special cases in _resolve_stem()
+    if (None, 'k2') in rv.get('color_modifier', ()):
+        rv['color_modifier'].add((None, None))
+    paw_hands = {(morph, tone) for morph, tone in rv.get('hand', ()) if morph == 'paw'}
+    if paw_hands:
+        rv.setdefault('hand_splayed', set()).update(paw_hands)
+    return rv
+
+
+def _variant_key(variant):
+    return tuple('' if bit is None else bit for bit in variant)
+
+
+def variants(shortcode):
+    """
+    Lists the (morph, tone) variants available for a shortcode or alias.
+
+    See load_variants() for what None means. Empty if the emoji doesn't exist.
+    """
+    return sorted(load_variants().get(shortcode, ()), key=_variant_key)
+
+
+def missing_variants(requests):
+    """
+    Checks (shortcode, morph, tone) requests in bulk against the index, without
+    touching any images.
+
+    Returns the requests that don't have an asset, in order.
+    """
+    return [
+        (shortcode, morph, tone)
+        for shortcode, morph, tone in requests
+        if not has_variant(shortcode, morph, tone)
+    ]
+
+
+@functools.lru_cache()
+def load_levels():
+    """
+    Loads the sizes (in pixels) of the downscaled levels, smallest first.
+
+    Empty if none were built; the full-size images are always available.
+    """
+    try:
+        with open_asset('levels.txt', encoding='utf-8') as levelsfile:
+            return sorted(int(line) for line in levelsfile if line.strip())
+    except FileNotFoundError:
+        return []
+
+
+def pick_level(pixels):
+    """
+    Returns the smallest level at least the given number of pixels across, or
+    None for full size.
+    """
+    for level in load_levels():
+        if level >= pixels:
+            return level
+    return None
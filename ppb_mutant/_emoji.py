@@ -0,0 +1,664 @@
+"""
+Emoji assets and morph/tone groups.
+"""
+import collections
+import logging
+import math
+import threading
+import time
+import weakref
+
+import ppb
+from ppb.flags import DoNotRender
+
+from . import _atlas, _palette, _profile, _shared, stats
+from ._memory import texture_memory
+from ._data import lookup_alias, pick_level, has_variant, packed_asset, stored_name, _resolve_name
+
+logger = logging.getLogger(__name__)
+
+# Keeps two threads from both restarting an unloaded Emoji
+_restart_lock = threading.Lock()
+
+# How often a drawn Emoji is recorded in texture_memory, in seconds: about once
+# a frame, which is all its least-recently-drawn order needs
+TOUCH_INTERVAL = 1 / 60
+
+
+class MainThreadCall:
+    """
+    An event that calls function on the main thread, between frames.
+
+    Queued with ppb's AssetLoaded events, which its asset system signals from
+    the main loop. It's always targeted at itself, so nothing else sees it.
+    """
+    def __init__(self, function):
+        self.function = function
+
+    @property
+    def __targets__(self):
+        return (self,)
+
+    @__targets__.setter
+    def __targets__(self, value):
+        # signal() resets it
+        pass
+
+    def on_main_thread_call(self, event, signal):
+        self.function()
+
+
+def call_on_main_thread(function):
+    """
+    Calls function from ppb's main loop, once the engine is running. Safe from
+    any thread.
+    """
+    ppb.assetlib._executor._event_queue.put(MainThreadCall(function))
+
+
+class Emoji(ppb.Image):
+    """
+    A Mutant Standard emoji.
+
+    Emoji are flyweights: every request for the same variant gets the same
+    object, which is only loaded once. (Variants with identical images are
+    still separate objects, loaded from the one stored copy.)
+
+    level picks a downscaled copy (see pick_level()); None is full size.
+
+    Raises ValueError if the index doesn't have this variant, unless validate
+    is False (in which case it'll be a placeholder when drawn).
+    """
+    _page = None  # The atlas page the loaded surface was cut from
+    _touched = None, 0.0  # (future, time) of the last texture_memory.touch()
+    def __new__(cls, shortcode, *, morph='hmn', tone=None, level=None, validate=True):
+        if validate and not has_variant(shortcode, morph, tone):
+            raise ValueError(f"No emoji {shortcode!r} with morph={morph!r} tone={tone!r}")
+        return super().__new__(cls, _resolve_name(shortcode, morph, tone, level))
+
+    def __init__(self, shortcode, *, morph='hmn', tone=None, level=None, validate=True):
+        self.shortcode = shortcode
+        self.morph = morph
+        self.tone = tone
+        self.level = level
+
+        if self._future is None or self._future.cancelled():
+            if stats.enabled:
+                stats.count('emoji.loads')
+            super().__init__(_resolve_name(self.shortcode, self.morph, self.tone, self.level))
+        elif stats.enabled:
+            stats.count('emoji.reused')
+
+    def __repr__(self):
+        return f"<{type(self).__name__} shortcode={self.shortcode!r} morph={self.morph!r} tone={self.tone!r} level={self.level!r} name={self.name!r}>"
+
+    def ensure_started(self):
+        """
+        Starts loading again if the image was unloaded to stay in budget or
+        its load was cancelled (eg, by a cancelled preload). Returns the
+        load's future, which is never None.
+        """
+        with _restart_lock:
+            future = self._future
+            if future is None or future.cancelled():
+                self._start()
+                future = self._future
+        return future
+
+    def load(self, timeout=None):
+        # Not BackgroundMixin.load(): _future may be unloaded again meanwhile
+        future = self._future
+        if future is None or future.cancelled():
+            future = self.ensure_started()
+        surface = future.result(timeout)
+        now = time.monotonic()
+        touched, when = self._touched
+        if touched is not future or now - when >= TOUCH_INTERVAL:
+            # A new future is a new surface, which always has to be counted
+            texture_memory.touch(self, surface)
+            self._touched = future, now
+        if _profile.recording is not None:
+            _profile.recording.note(self.shortcode, self.morph, self.tone)
+        return surface
+
+    def __del__(self):
+        # FreeingMixin frees through load(), which would count as a draw
+        self._unload(later=True)
+
+    def _unload(self, later=False):
+        """
+        Frees the decoded surface. The next load() decodes it again.
+
+        later defers letting go of its atlas page, for finalizers (see
+        _atlas.release_page_later()).
+        """
+        future, self._future = self._future, None
+        if future is not None and future.done() and not future.cancelled() and future.exception() is None:
+            self.free(future.result())
+        page, self._page = self._page, None
+        if page is not None and later:
+            _atlas.release_page_later(page)
+        elif page is not None:
+            _atlas.release_page(page)
+
+    @property
+    def region(self):
+        """
+        The atlas region (page, x, y, width, height) this is cut from, or None
+        if it's a standalone file.
+        """
+        return _atlas.lookup_region(stored_name(self.name))
+
+    def _background(self):
+        # Called in background thread
+        name = stored_name(self.name)
+        try:
+            if _shared.active is not None:
+                return _shared.active.load(name, self._decode)
+            return self._decode()
+        except FileNotFoundError:
+            # Not in _decode(), so placeholders are never shared
+            logger.warning("File not found: %r. %s", name, self.not_found_message)
+            return self.file_missing()
+
+    def _decode(self):
+        name = stored_name(self.name)
+        recolor = _palette.lookup(name)
+        if recolor is not None:
+            return _palette.recolored(*recolor)
+        region = _atlas.lookup_region(name)
+        if region is not None:
+            surface = _atlas.cut_region(*region)
+            # Held until _unload()
+            self._page = region[0]
+            return surface
+        data = packed_asset(name)
+        if data is not None:
+            return self.background_parse(data)
+        with ppb.vfs.open(name) as file:
+            return self.background_parse(file.read())
+
+
+class VariantCache:
+    """
+    Emoji variants shared by every MorphToneGroup, one per resolved asset.
+
+    Entries are reference counted by the proxies showing them. Once nothing
+    references an entry, it's kept idle (so switching back to it is free) until
+    more than max_idle entries are idle, when the least recently released go.
+    max_idle=0 drops entries as soon as they're released.
+    """
+    def __init__(self, max_idle=256):
+        self.max_idle = max_idle
+        self._refs = {}  # name: [emoji, count]
+        self._idle = collections.OrderedDict()  # name: emoji, oldest first
+        self._released = collections.deque()  # From finalizers; see release_later()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._refs) + len(self._idle)
+
+    @property
+    def referenced(self):
+        """
+        How many entries are in use.
+        """
+        return len(self._refs)
+
+    @property
+    def idle(self):
+        """
+        How many entries are kept without being used.
+        """
+        return len(self._idle)
+
+    def acquire(self, shortcode, *, morph='hmn', tone=None, level=None):
+        """
+        Gets the Emoji for a variant, counting a reference to it. Hand it back
+        with release() when done.
+        """
+        self._drain()
+        name = _resolve_name(shortcode, morph, tone, level)
+        with self._lock:
+            entry = self._refs.get(name)
+            if entry is None:
+                emoji = self._idle.pop(name, None)
+                if emoji is not None:
+                    entry = self._refs[name] = [emoji, 0]
+            if entry is not None:
+                entry[1] += 1
+        if entry is not None:
+            # It may have been unloaded to stay in budget since
+            entry[0].ensure_started()
+            if stats.enabled:
+                stats.count('cache.hits')
+            return entry[0]
+
+        # Groups can be switched to morphs that some of their emoji lack
+        emoji = Emoji(shortcode, morph=morph, tone=tone, level=level, validate=False)
+        with self._lock:
+            entry = self._refs.setdefault(name, [emoji, 0])
+            entry[1] += 1
+        if stats.enabled:
+            stats.count('cache.misses')
+        return entry[0]
+
+    def references(self, emoji):
+        """
+        How many references acquire() has handed out to an Emoji and haven't
+        been released.
+        """
+        self._drain()
+        with self._lock:
+            entry = self._refs.get(emoji.name)
+        return 0 if entry is None or entry[0] is not emoji else entry[1]
+
+    def release(self, emoji):
+        """
+        Drops a reference taken by acquire().
+        """
+        self._drain()
+        self._release(emoji)
+
+    def release_later(self, emoji):
+        """
+        Like release(), but safe to call from __del__, which the GC may run
+        while this thread holds the cache's lock. The reference is dropped on
+        the next acquire(), release() or trim().
+        """
+        self._released.append(emoji)
+
+    def _drain(self):
+        while True:
+            try:
+                emoji = self._released.popleft()
+            except IndexError:
+                return
+            self._release(emoji)
+
+    def _release(self, emoji):
+        with self._lock:
+            entry = self._refs.get(emoji.name)
+            if entry is None:
+                return
+            entry[1] -= 1
+            if entry[1] > 0:
+                return
+            del self._refs[emoji.name]
+            if self.max_idle > 0:
+                self._idle[emoji.name] = entry[0]
+            if len(self._idle) > self.max_idle:
+                self._evict(self.max_idle)
+
+    def _evict(self, keep):
+        # Called with the lock held
+        evicted = 0
+        while len(self._idle) > keep:
+            self._idle.popitem(last=False)
+            evicted += 1
+        if evicted and stats.enabled:
+            stats.count('cache.evictions', evicted)
+
+    def trim(self, keep=0):
+        """
+        Drops idle entries until at most keep are left.
+        """
+        self._drain()
+        with self._lock:
+            self._evict(keep)
+
+
+#: The cache used by every MorphToneGroup
+variant_cache = VariantCache()
+
+
+class MorphToneProxy:
+    """
+    A proxy for Emoji used with MorphToneGroup.
+
+    Use MorphToneGroup to construct.
+    """
+    _image = None
+
+    def __init__(self, shortcode, group):
+        self.shortcode = shortcode
+        self._group = group
+        self._reload()
+
+    def __repr__(self):
+        return f"<{type(self).__name__} shortcode={self.shortcode!r} group={self._group!r}>"
+
+    def __del__(self):
+        if self._image is not None:
+            variant_cache.release_later(self._image)
+
+    @property
+    def morph(self):
+        return self._group.morph
+
+    @property
+    def tone(self):
+        return self._group.tone
+
+    @property
+    def level(self):
+        return self._group.level
+
+    @property
+    def region(self):
+        if self._image is None:
+            self._reload()
+        return self._image.region
+
+    def _needs_reload(self):
+        return (
+            self._image is None
+            or lookup_alias(self.shortcode) is not None
+            or self._image.level != self.level
+        )
+
+    def _resolve(self):
+        # Takes a reference to the image, for _set_image() to hand over
+        return variant_cache.acquire(self.shortcode, morph=self.morph, tone=self.tone, level=self.level)
+
+    def _set_image(self, image):
+        old, self._image = self._image, image
+        if old is not None:
+            variant_cache.release(old)
+
+    def _reload(self):
+        if self._needs_reload():
+            if stats.enabled:
+                stats.count('proxy.reloads')
+            self._set_image(self._resolve())
+
+    def load(self):
+        if self._image is None:
+            self._reload()
+        return self._image.load()
+
+
+class MorphToneGroup:
+    """
+    A group of emoji that share a changable morph/tone.
+
+    With prefetch=True, a morph/tone change loads the new variants in the
+    background while the group keeps showing the old ones, then swaps every
+    emoji in the group at once when they're all ready.
+
+    level picks downscaled copies for every emoji in the group; see fit().
+
+    Groups share their images through variant_cache, so groups showing the same
+    morph/tone cost no more than one.
+    """
+    def __init__(self, *, morph='hmn', tone=None, level=None, prefetch=False):
+        self._emoji = weakref.WeakValueDictionary()
+        self._morph = morph
+        self._tone = tone
+        self._level = level
+        self.prefetch = prefetch
+        self._generation = 0
+        self._pending = None  # {shortcode: (proxy ref, image)} not swapped in yet
+        self._remaining = 0
+        self._callback = None
+        self._lock = threading.Lock()
+        stats.track_group(self)
+
+    @property
+    def morph(self):
+        return self._morph
+
+    @morph.setter
+    def morph(self, value):
+        self.set_morphtone(value, self._tone)
+
+    @property
+    def tone(self):
+        return self._tone
+
+    @tone.setter
+    def tone(self, value):
+        self.set_morphtone(self._morph, value)
+
+    @property
+    def level(self):
+        return self._level
+
+    @level.setter
+    def level(self, value):
+        self._level = value
+        self._reload()
+
+    def fit(self, pixel_ratio, size=1):
+        """
+        Picks the smallest level that looks right for sprites of the given size
+        (in game units) drawn at the given pixel ratio, reloading only if
+        that's a different level.
+
+        Cheap enough to call every frame.
+        """
+        if not pixel_ratio:
+            return
+        level = pick_level(math.ceil(pixel_ratio * size))
+        if level != self._level:
+            self.level = level
+
+    def set_morphtone(self, morph, tone, *, callback=None):
+        """
+        Change the morph and tone together.
+
+        callback is called with no arguments once the group shows the new
+        variants: right away, or (if prefetching) when they're swapped in.
+        Prefetched variants are swapped in on the main thread, between frames,
+        so a frame never mixes old and new ones; the callback is called there
+        too. It isn't called if another change supersedes this one first.
+        """
+        self._morph = morph
+        self._tone = tone
+        self._reload(callback)
+
+    @stats.timed('group.reload')
+    def _reload(self, callback=None):
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+            stale, self._pending = self._pending, None
+        if stale:
+            self._release_pending(stale)
+
+        if not self.prefetch:
+            for emoji in list(self._emoji.values()):
+                emoji._reload()
+            if callback is not None:
+                callback()
+            return
+
+        # Proxies are held weakly until the swap, so ones that are dropped
+        # meanwhile still go
+        pending = {
+            proxy.shortcode: (weakref.ref(proxy), proxy._resolve())
+            for proxy in list(self._emoji.values())
+            if proxy._needs_reload()
+        }
+        if stats.enabled:
+            stats.count('proxy.prefetches', len(pending))
+        with self._lock:
+            if generation == self._generation:
+                self._pending = pending
+                self._remaining = len(pending)
+                self._callback = callback
+                stale = None
+            else:
+                stale = pending
+        if stale:
+            # Superseded while resolving
+            self._release_pending(stale)
+            return
+
+        if not pending:
+            self._swap(generation)
+            return
+        # The futures outlive the swap, so their callbacks only hold weak
+        # references
+        group = weakref.ref(self)
+
+        def swap():
+            # Called on the main thread
+            self = group()
+            if self is not None:
+                self._swap(generation)
+
+        def ready(_):
+            # Called in background threads
+            self = group()
+            if self is not None and self._ready(generation):
+                call_on_main_thread(swap)
+
+        for _, image in pending.values():
+            image.ensure_started().add_done_callback(ready)
+
+    def _ready(self, generation):
+        """
+        Counts a prefetched variant as loaded. Returns True for the last one.
+        """
+        with self._lock:
+            if generation != self._generation or self._pending is None:
+                return False
+            self._remaining -= 1
+            return self._remaining == 0
+
+    def _swap(self, generation):
+        """
+        Swaps the prefetched variants in, unless they've been superseded.
+        """
+        with self._lock:
+            if generation != self._generation or self._pending is None:
+                return
+            pending, self._pending = self._pending, None
+            callback, self._callback = self._callback, None
+        for ref, image in pending.values():
+            proxy = ref()
+            if proxy is None:
+                variant_cache.release(image)
+            else:
+                proxy._set_image(image)
+        if callback is not None:
+            callback()
+
+    @staticmethod
+    def _release_pending(pending):
+        for _, image in pending.values():
+            variant_cache.release(image)
+
+    def __call__(self, shortcode):
+        """
+        Get an emoji asset
+        """
+        # We do things in this particular way to avoid race conditions around the gc
+        try:
+            return self._emoji[shortcode]
+        except KeyError:
+            e = MorphToneProxy(shortcode, self)
+            self._emoji[shortcode] = e
+            return e
+
+
+class _Observed:
+    """
+    Sprite attribute that throws away the sprite's resolved image when set.
+    """
+    def __init__(self, default=None):
+        self.default = default
+
+    def __set_name__(self, owner, name):
+        self.name = name
+        self.key = f"_observed_{name}"
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        return instance.__dict__.get(self.key, self.default)
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.key] = value
+        instance.__dict__.pop('_resolved_image', None)
+
+
+class EmojiSpriteMixin:
+    """
+    Sprite mixin that shows an emoji picked by its emoji, morph, tone and level
+    attributes.
+
+    The image is resolved once and kept; setting any of those attributes
+    resolves it again on the next draw. Nothing is checked per frame.
+
+    Give sprites a shared MorphToneGroup as group to retone them all at once
+    by changing the group; their own morph and tone are ignored then.
+
+    Subclasses can set the attributes as plain class attributes.
+    """
+    _OBSERVED = ('emoji', 'morph', 'tone', 'level', 'group')
+
+    emoji = _Observed('no_entry')
+    morph = _Observed('hmn')
+    tone = _Observed()
+    level = _Observed()
+    group = _Observed()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # A plain `emoji = 'hand'` would hide the descriptor, so wrap it
+        for name in cls._OBSERVED:
+            value = cls.__dict__.get(name)
+            if name in cls.__dict__ and not isinstance(value, _Observed):
+                observed = _Observed(value)
+                observed.__set_name__(cls, name)
+                setattr(cls, name, observed)
+
+    @property
+    def image(self):
+        try:
+            return self.__dict__['_resolved_image']
+        except KeyError:
+            image = self.__dict__['_resolved_image'] = self.resolve_image()
+            return image
+
+    @image.setter
+    def image(self, value):
+        # Shown until one of the observed attributes changes
+        self.__dict__['_resolved_image'] = value
+
+    def resolve_image(self):
+        """
+        Works out the image for the current attributes. Called once per change.
+        """
+        emoji = self.emoji
+        if emoji is DoNotRender or emoji is None:
+            return DoNotRender
+        emoji = emoji.rsplit('/', 1)[-1]
+        if self.group is not None:
+            return self.group(emoji)
+        return Emoji(emoji, morph=self.morph, tone=self.tone, level=self.level, validate=False)
+
+    def fit(self, pixel_ratio):
+        """
+        Picks the smallest level that looks right for this sprite's size drawn
+        at the given pixel ratio, like MorphToneGroup.fit(), resolving again
+        only if that's a different level.
+
+        Sprites with a group show the group's level; fit the group instead.
+        """
+        if not pixel_ratio:
+            return
+        level = pick_level(math.ceil(pixel_ratio * self.size))
+        if level != self.level:
+            self.level = level
+
+
+class MutantSprite(EmojiSpriteMixin, ppb.BaseSprite):
+    """
+    Deprecated
+    """
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        logger.warn("MutantSprite is deprecated. Use the Emoji, MorphToneGroup or EmojiSpriteMixin instead (in %s)", cls.__name__)
@@ -0,0 +1,136 @@
+"""
+Finding the sprite under a point without asking every sprite.
+"""
+import collections
+import math
+
+
+class HitGrid:
+    """
+    A uniform grid over sprite bounds.
+
+    Each sprite is filed under every cell its bounds touch, so finding what's
+    under a point only checks the sprites in that point's cell.
+
+    Sprites that moved or resized (by assigning position, width or height)
+    since they were filed are re-filed by the next at() or sync(). That's a
+    quick check of every sprite, but only when hit testing, not every frame.
+    """
+    def __init__(self, cell_size=1.0):
+        self.cell_size = cell_size
+        self._cells = collections.defaultdict(list)
+        self._where = {}  # sprite: (cells, tags, (position, width, height) when filed)
+
+    def __len__(self):
+        return len(self._where)
+
+    def __contains__(self, sprite):
+        return sprite in self._where
+
+    def _cell(self, x, y):
+        return math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+
+    def _cells_for(self, sprite):
+        xmin, ymin = self._cell(sprite.left, sprite.bottom)
+        xmax, ymax = self._cell(sprite.right, sprite.top)
+        return [
+            (x, y)
+            for x in range(xmin, xmax + 1)
+            for y in range(ymin, ymax + 1)
+        ]
+
+    def add(self, sprite, tags=()):
+        """
+        Start tracking a sprite, filed under the given tags.
+        """
+        self.remove(sprite)
+        cells = self._cells_for(sprite)
+        self._where[sprite] = cells, frozenset(tags), _placement(sprite)
+        for cell in cells:
+            self._cells[cell].append(sprite)
+
+    def remove(self, sprite):
+        """
+        Stop tracking a sprite. Does nothing if it isn't tracked.
+        """
+        cells, *_ = self._where.pop(sprite, ((), None, None))
+        for cell in cells:
+            bucket = self._cells[cell]
+            bucket.remove(sprite)
+            if not bucket:
+                del self._cells[cell]
+
+    def move(self, sprite):
+        """
+        Re-file a sprite after its position or size changed.
+        """
+        if sprite in self._where:
+            self.add(sprite, self._where[sprite][1])
+
+    def sync(self):
+        """
+        Re-file every sprite that moved or resized since it was filed.
+        """
+        moved = [
+            sprite
+            for sprite, (_, _, (position, width, height)) in self._where.items()
+            # Vectors are immutable, so a move means a new one
+            if sprite.position is not position or sprite.width != width or sprite.height != height
+        ]
+        for sprite in moved:
+            self.move(sprite)
+
+    def at(self, point, *, tag=None):
+        """
+        The sprite under the given point (the most recently added, if several
+        overlap), or None.
+
+        If tag is given, only sprites added with that tag are considered.
+        """
+        self.sync()
+        x, y = point
+        for sprite in reversed(self._cells.get(self._cell(x, y), ())):
+            if tag is not None and tag not in self._where[sprite][1]:
+                continue
+            if sprite.left <= x <= sprite.right and sprite.bottom <= y <= sprite.top:
+                return sprite
+        return None
+
+
+def _placement(sprite):
+    # What a sprite's bounds come from
+    return sprite.position, sprite.width, sprite.height
+
+
+class HitTestMixin:
+    """
+    Scene mixin that keeps a HitGrid of its clickable sprites.
+
+    Sprites added with any tag in hit_test_tags go in self.hit_grid. Clicks go
+    only to the sprite under the mouse, through its do_click(mouse, signal)
+    method, instead of to every sprite's on_button_pressed. Sprites can move
+    freely; the grid catches up when clicked.
+    """
+    #: Sprites added with any of these tags are hit tested
+    hit_test_tags = ()
+    #: Grid cell size, in game units. About one sprite across works well.
+    hit_test_cell_size = 1.0
+
+    def __init__(self, *p, **kw):
+        self.hit_grid = HitGrid(self.hit_test_cell_size)
+        super().__init__(*p, **kw)
+
+    def add(self, game_object, tags=()):
+        super().add(game_object, tags)
+        tags = [tag for tag in tags if tag in self.hit_test_tags]
+        if tags:
+            self.hit_grid.add(game_object, tags)
+
+    def remove(self, game_object):
+        super().remove(game_object)
+        self.hit_grid.remove(game_object)
+
+    def on_button_pressed(self, mouse, signal):
+        sprite = self.hit_grid.at(mouse.position)
+        if sprite is not None and hasattr(sprite, 'do_click'):
+            sprite.do_click(mouse, signal)
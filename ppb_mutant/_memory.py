@@ -0,0 +1,155 @@
+"""
+Accounting for decoded emoji pixels, and keeping them under a budget.
+"""
+import collections
+import contextlib
+import threading
+import weakref
+
+from . import stats
+
+
+class TextureMemory:
+    """
+    Counts the bytes of every decoded Emoji surface, in order of when each
+    was last drawn (loaded).
+
+    If budget (in bytes) is set, going over it unloads the least recently
+    drawn emoji until it fits again. They decode again the next time they're
+    drawn, so keep the budget above what one frame shows.
+
+    Only loads on the main thread, where ppb draws, unload anything, so a
+    surface is never freed while a background thread uses it. Background
+    threads that use surfaces across loads hold them with pinned().
+    """
+    def __init__(self, budget=None):
+        self.used = 0
+        self.evictions = 0
+        self._lock = threading.RLock()
+        self._resident = collections.OrderedDict()  # id: (weakref, bytes), oldest first
+        self._pins = collections.Counter()  # id: count
+        self._other = {}  # key: bytes
+        self.budget = budget
+
+    def __len__(self):
+        return len(self._resident)
+
+    @property
+    def budget(self):
+        return self._budget
+
+    @budget.setter
+    def budget(self, value):
+        with self._lock:
+            self._budget = value
+            if value is not None and self.used > value:
+                self._evict(value)
+
+    def touch(self, emoji, surface):
+        """
+        Records that emoji was drawn, with the surface it loaded.
+        """
+        key = id(emoji)
+        with self._lock:
+            if key in self._resident:
+                self._resident.move_to_end(key)
+                return
+            size = surface.contents.pitch * surface.contents.h
+            ref = weakref.ref(emoji, lambda ref, key=key: self._forget(key, ref))
+            self._resident[key] = ref, size
+            self.used += size
+            if (
+                self._budget is not None and self.used > self._budget
+                and threading.current_thread() is threading.main_thread()
+            ):
+                self._evict(self._budget, keep=key)
+
+    def add_other(self, key, size):
+        """
+        Counts size bytes of surfaces that aren't Emoji (like atlas pages)
+        under key, until remove_other(key). These aren't unloaded, but count
+        against the budget.
+        """
+        with self._lock:
+            self.used += size - self._other.get(key, 0)
+            self._other[key] = size
+            if (
+                self._budget is not None and self.used > self._budget
+                and threading.current_thread() is threading.main_thread()
+            ):
+                self._evict(self._budget)
+
+    def remove_other(self, key):
+        """
+        Stops counting what add_other() counted under key.
+        """
+        with self._lock:
+            self.used -= self._other.pop(key, 0)
+
+    @contextlib.contextmanager
+    def pinned(self, emoji):
+        """
+        Keeps emoji from being unloaded while in the block.
+        """
+        key = id(emoji)
+        with self._lock:
+            self._pins[key] += 1
+        try:
+            yield emoji
+        finally:
+            with self._lock:
+                self._pins[key] -= 1
+                if not self._pins[key]:
+                    del self._pins[key]
+
+    def _forget(self, key, ref):
+        # Called when an emoji is collected, which frees its surface
+        with self._lock:
+            entry = self._resident.get(key)
+            if entry is not None and entry[0] is ref:
+                del self._resident[key]
+                self.used -= entry[1]
+
+    def _evict(self, budget, keep=None):
+        # Called with the lock held
+        evicted = 0
+        for key in list(self._resident):
+            if self.used <= budget:
+                break
+            if key == keep or key in self._pins:
+                continue
+            ref, size = self._resident.pop(key)
+            self.used -= size
+            emoji = ref()
+            if emoji is not None:
+                emoji._unload()
+            evicted += 1
+        self.evictions += evicted
+        if evicted and stats.enabled:
+            stats.count('textures.evictions', evicted)
+
+    def trim(self, budget=0):
+        """
+        Unloads the least recently drawn emoji until at most budget bytes are
+        used.
+        """
+        with self._lock:
+            self._evict(budget)
+
+    def usage(self):
+        """
+        {bytes, count, other, budget, evictions}, as plain data. bytes
+        includes other surfaces, like atlas pages.
+        """
+        with self._lock:
+            return {
+                'bytes': self.used,
+                'count': len(self._resident),
+                'other': len(self._other),
+                'budget': self.budget,
+                'evictions': self.evictions,
+            }
+
+
+#: The accounting for every Emoji
+texture_memory = TextureMemory()
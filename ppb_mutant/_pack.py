@@ -0,0 +1,118 @@
+"""
+The packed assets container (assets.pack): the reader, and the writer
+`download_zips.py --pack` uses.
+
+Every asset file in one, so an install is a single file and reading an asset is
+slicing a memory map:
+
+* header: MAGIC, then the file count and hash table capacity (HEADER)
+* file records: (name, data) as refs (FILE_RECORD); name offsets are into the
+  name blob, data offsets are from the start of the container
+* an open-addressed hash table of uint32 record numbers by name, EMPTY for
+  unused slots, probed linearly from crc32(name) like the compiled index
+* the name blob, UTF-8
+* the file data, each aligned to DATA_ALIGN
+"""
+import struct
+
+from ._binindex import SLOT, EMPTY, build_table, slot_of
+
+MAGIC = b'MTNTPAK1'
+HEADER = struct.Struct('<8s2I')
+FILE_RECORD = struct.Struct('<4I')
+DATA_ALIGN = 16
+
+
+class PackedAssets:
+    """
+    Read-only view of a packed assets container.
+
+    buf may be bytes or an mmap. Files come back as memoryviews into it.
+    """
+    def __init__(self, buf):
+        magic, self._count, self._capacity = HEADER.unpack_from(buf, 0)
+        if magic != MAGIC:
+            raise ValueError(f"Not a packed assets container (magic {magic!r})")
+        self._buf = memoryview(buf)
+        self._records_at = HEADER.size
+        self._table_at = self._records_at + self._count * FILE_RECORD.size
+        self._names_at = self._table_at + self._capacity * SLOT.size
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, filename):
+        return self._find(filename) is not None
+
+    def _record(self, num):
+        return FILE_RECORD.unpack_from(self._buf, self._records_at + num * FILE_RECORD.size)
+
+    def _name(self, offset, length):
+        start = self._names_at + offset
+        return bytes(self._buf[start:start + length]).decode('utf-8')
+
+    def _find(self, filename):
+        if not self._capacity:
+            return None
+        slot = slot_of(filename, self._capacity)
+        for _ in range(self._capacity):
+            num, = SLOT.unpack_from(self._buf, self._table_at + slot * SLOT.size)
+            if num == EMPTY:
+                return None
+            record = self._record(num)
+            if self._name(*record[:2]) == filename:
+                return record
+            slot = (slot + 1) & (self._capacity - 1)
+        return None
+
+    def get(self, filename):
+        """
+        The contents of the given file, or None if it isn't packed.
+        """
+        record = self._find(filename)
+        if record is None:
+            return None
+        _, _, offset, length = record
+        return self._buf[offset:offset + length]
+
+    def names(self):
+        """
+        Yields every packed filename, in build order
+        """
+        for num in range(self._count):
+            yield self._name(*self._record(num)[:2])
+
+
+class PackWriter:
+    """
+    Writes a packed assets container (see download_zips.py).
+    """
+    def __init__(self):
+        self.files = {}
+
+    def add(self, name, data):
+        self.files[name] = data
+
+    def write(self, stream):
+        names = bytearray()
+        name_refs = []
+        for name in self.files:
+            data = name.encode('utf-8')
+            name_refs.append((len(names), len(data)))
+            names += data
+        capacity, table = build_table(list(self.files))
+
+        data_at = HEADER.size + len(self.files) * FILE_RECORD.size + len(table) + len(names)
+        records = bytearray()
+        chunks = []
+        offset = data_at
+        for (name_at, name_len), data in zip(name_refs, self.files.values()):
+            padding = -offset % DATA_ALIGN
+            offset += padding
+            records += FILE_RECORD.pack(name_at, name_len, offset, len(data))
+            chunks += [bytes(padding), data]
+            offset += len(data)
+
+        stream.write(HEADER.pack(MAGIC, len(self.files), capacity))
+        for chunk in (records, table, names, *chunks):
+            stream.write(chunk)
@@ -0,0 +1,205 @@
+"""
+Palette recoloring: tone variants made from their base image at load time,
+for asset sets built with `download_zips.py --recolor`.
+
+The build drops every tone variant that's exactly its base image with the
+tone's palette swapped in, and records it in recolor.txt. Those variants are
+recolored here instead of being opened. NumPy does the swap if it's installed;
+otherwise it's done in plain Python, which is slower but fine at emoji sizes.
+"""
+import ctypes
+import functools
+import io
+
+from sdl2 import (
+    rw_from_object, SDL_ConvertSurfaceFormat, SDL_CreateRGBSurfaceWithFormat,
+    SDL_FreeSurface, SDL_SetSurfaceBlendMode, SDL_PIXELFORMAT_RGBA32,
+    SDL_BLENDMODE_BLEND,
+)
+from sdl2.sdlimage import IMG_Load_RW
+from ppb.systems.sdl_utils import sdl_call, img_call
+
+from . import _atlas, stats
+from ._data import ASSET_PREFIX, open_asset
+
+
+@functools.lru_cache()
+def load_recolor():
+    """
+    Loads the recolor table, {shortcode: (base shortcode, tone)}
+    """
+    rv = {}
+    try:
+        with open_asset('recolor.txt', encoding='utf-8') as recolorfile:
+            for line in recolorfile:
+                line = line.rstrip('\n')
+                if line:
+                    code, base, tone = line.split('\t')
+                    rv[code] = base, tone
+    except FileNotFoundError:
+        pass
+    return rv
+
+
+@functools.lru_cache()
+def load_palettes():
+    """
+    Loads the tone palettes, {tone: {base RGB: tone RGB}}, colors packed as
+    0xRRGGBB.
+    """
+    rv = {}
+    try:
+        with open_asset('palettes.txt', encoding='utf-8') as palettefile:
+            for line in palettefile:
+                line = line.rstrip('\n')
+                if line:
+                    tone, src, dst = line.split('\t')
+                    rv.setdefault(tone, {})[int(src, 16)] = int(dst, 16)
+    except FileNotFoundError:
+        pass
+    return rv
+
+
+def lookup(name):
+    """
+    Returns (base asset name, tone) if the given asset name is made by
+    recoloring, or None if it's a file of its own.
+
+    Downscaled copies are always files of their own: resampling blends colors,
+    so the palettes only fit full-size images.
+    """
+    if not name.startswith(ASSET_PREFIX) or not name.endswith('.png'):
+        return None
+    stem = name[len(ASSET_PREFIX):-len('.png')]
+    try:
+        base, tone = load_recolor()[stem]
+    except KeyError:
+        return None
+    return f"{ASSET_PREFIX}{base}.png", tone
+
+
+@functools.lru_cache()
+def _numpy():
+    # Optional, and only looked for once something is actually recolored
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+@functools.lru_cache()
+def _palette(tone):
+    palette = load_palettes().get(tone, {})
+    numpy = _numpy()
+    if numpy is not None:
+        src = numpy.array(sorted(palette), dtype=numpy.uint32)
+        dst = numpy.array([palette[color] for color in src.tolist()], dtype=numpy.uint32)
+        return src, dst
+    else:
+        return {
+            src.to_bytes(3, 'big'): dst.to_bytes(3, 'big')
+            for src, dst in palette.items()
+        }
+
+
+def _recolor_numpy(data, src, dst):
+    numpy = _numpy()
+    pixels = numpy.frombuffer(data, dtype=numpy.uint8).reshape(-1, 4).copy()
+    if not len(src):
+        return pixels.tobytes()
+    rgb = pixels[:, :3].astype(numpy.uint32)
+    keys = (rgb[:, 0] << 16) | (rgb[:, 1] << 8) | rgb[:, 2]
+    slots = numpy.minimum(numpy.searchsorted(src, keys), len(src) - 1)
+    hits = src[slots] == keys
+    colors = dst[slots[hits]]
+    pixels[hits, 0] = colors >> 16
+    pixels[hits, 1] = (colors >> 8) & 0xFF
+    pixels[hits, 2] = colors & 0xFF
+    return pixels.tobytes()
+
+
+def _recolor_python(data, palette):
+    pixels = bytearray(data)
+    for i in range(0, len(pixels), 4):
+        color = palette.get(bytes(pixels[i:i + 3]))
+        if color is not None:
+            pixels[i:i + 3] = color
+    return bytes(pixels)
+
+
+def recolor_pixels(data, tone):
+    """
+    Swaps the tone's palette into RGBA32 pixel data. Alpha is left alone.
+    """
+    if _numpy() is not None:
+        return _recolor_numpy(data, *_palette(tone))
+    else:
+        return _recolor_python(data, _palette(tone))
+
+
+def _decode(name):
+    region = _atlas.lookup_region(name)
+    if region is not None:
+        return _atlas.cut_region(*region)
+    with open_asset(name[len(ASSET_PREFIX):]) as imagefile:
+        data = imagefile.read()
+    return img_call(
+        IMG_Load_RW, rw_from_object(io.BytesIO(data)), False,
+        _check_error=lambda rv: not rv
+    )
+
+
+@functools.lru_cache(maxsize=64)
+def _base_pixels(name):
+    """
+    Decodes a base image to (width, height, RGBA32 bytes).
+
+    Kept around so every tone of an emoji shares one decode.
+    """
+    surface = _decode(name)
+    try:
+        converted = sdl_call(
+            SDL_ConvertSurfaceFormat, surface, SDL_PIXELFORMAT_RGBA32, 0,
+            _check_error=lambda rv: not rv
+        )
+    finally:
+        SDL_FreeSurface(surface)
+        region = _atlas.lookup_region(name)
+        if region is not None:
+            _atlas.release_page(region[0])
+    try:
+        info = converted.contents
+        row = info.w * 4
+        data = ctypes.string_at(info.pixels, info.pitch * info.h)
+        if info.pitch != row:
+            data = b''.join(data[y * info.pitch:y * info.pitch + row] for y in range(info.h))
+        return info.w, info.h, data
+    finally:
+        SDL_FreeSurface(converted)
+
+
+@stats.timed('palette.recolor')
+def recolored(base_name, tone):
+    """
+    Makes a new surface of the base image in the given tone.
+
+    Called in the background thread.
+    """
+    width, height, data = _base_pixels(base_name)
+    data = recolor_pixels(data, tone)
+    surface = sdl_call(
+        SDL_CreateRGBSurfaceWithFormat, 0, width, height, 32, SDL_PIXELFORMAT_RGBA32,
+        _check_error=lambda rv: not rv
+    )
+    info = surface.contents
+    row = width * 4
+    for y in range(height):
+        ctypes.memmove(info.pixels + y * info.pitch, data[y * row:(y + 1) * row], row)
+    sdl_call(
+        SDL_SetSurfaceBlendMode, surface, SDL_BLENDMODE_BLEND,
+        _check_error=lambda rv: rv < 0
+    )
+    if stats.enabled:
+        stats.count('palette.recolors')
+    return surface
@@ -0,0 +1,157 @@
+"""
+Loading emoji ahead of time, with progress for loading scenes.
+"""
+import itertools
+import threading
+
+from . import stats
+from ._data import has_variant
+from ._emoji import MorphToneGroup, variant_cache
+from ._profile import UsageProfile
+
+
+def _expand(items, morphs, tones, level):
+    for item in items:
+        if isinstance(item, MorphToneGroup):
+            for proxy in list(item._emoji.values()):
+                yield proxy.shortcode, item.morph, item.tone, item.level
+        else:
+            for morph in morphs:
+                for tone in tones:
+                    # Not every emoji comes in every morph/tone asked for
+                    if has_variant(item, morph, tone):
+                        yield item, morph, tone, level
+
+
+class Preload:
+    """
+    A batch of emoji loading in the background. Use preload() to start one.
+
+    The images are held until release() or cancel(), so they're still there
+    when the scene that needs them starts.
+    """
+    def __init__(self, variants):
+        self._lock = threading.Lock()
+        self._finished = threading.Event()
+        self._cancelled = False
+        self.loaded = 0
+        self.failed = 0
+
+        images = {}
+        for shortcode, morph, tone, level in variants:
+            image = variant_cache.acquire(shortcode, morph=morph, tone=tone, level=level)
+            if image.name in images:
+                variant_cache.release(image)
+            else:
+                images[image.name] = image
+        self._images = list(images.values())
+        self.total = len(self._images)
+        if stats.enabled:
+            stats.count('preload.queued', self.total)
+
+        if not self._images:
+            self._finished.set()
+        for image in self._images:
+            image.ensure_started().add_done_callback(self._done)
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.loaded + self.failed}/{self.total}{' cancelled' if self._cancelled else ''}>"
+
+    def _done(self, future):
+        # Called in background threads
+        with self._lock:
+            if future.cancelled() or future.exception() is not None:
+                self.failed += 1
+            else:
+                self.loaded += 1
+            if self.loaded + self.failed >= self.total:
+                self._finished.set()
+
+    @property
+    def progress(self):
+        """
+        How much is done, from 0 to 1. Cheap enough to show every frame.
+        """
+        if not self.total:
+            return 1.0
+        return (self.loaded + self.failed) / self.total
+
+    @property
+    def finished(self):
+        """
+        Whether everything is loaded (or failed, or was cancelled).
+        """
+        return self._finished.is_set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled
+
+    def wait(self, timeout=None):
+        """
+        Blocks until everything is loaded, or timeout seconds. Returns finished.
+
+        Loading only starts once the engine is running.
+        """
+        return self._finished.wait(timeout)
+
+    def cancel(self):
+        """
+        Stops loading whatever hasn't started yet and lets go of the images.
+
+        Emoji are shared, so only loads nothing else has a reference to or is
+        waiting on are stopped; the rest carry on. Emoji whose loads were
+        cancelled load normally if they're drawn later.
+        """
+        self._cancelled = True
+        for image in self._images:
+            future = image._future
+            if future is not None and _only_holder(image, future):
+                future.cancel()
+        self.release()
+
+    def release(self):
+        """
+        Lets go of the images, once whatever needed them has its own.
+        """
+        images, self._images = self._images, []
+        for image in images:
+            variant_cache.release(image)
+
+
+def _only_holder(image, future):
+    # Whether a preload's reference is the only one: nothing else acquired the
+    # image, and nothing is chained on its load (ppb's gather() waits on it
+    # from a thread that dies if it's cancelled)
+    return variant_cache.references(image) == 1 and not future._waiters
+
+
+def preload(items, *, morphs=('hmn',), tones=(None,), level=None):
+    """
+    Starts loading emoji in the background, on ppb's asset workers.
+
+    items may be shortcodes, aliases, or MorphToneGroups (everything the group
+    currently has, in its current morph/tone). Shortcodes and aliases are
+    loaded in every given morph and tone that exists.
+
+    Returns a Preload to watch progress on or cancel.
+    """
+    return Preload(_expand(items, morphs, tones, level))
+
+
+def prewarm(profile, *, limit=None, level=None):
+    """
+    Starts loading the emoji a UsageProfile (or the path to one) recorded,
+    most wanted first, like preload().
+
+    limit caps how many variants are loaded. Variants no longer in the index
+    are skipped, and a missing profile file loads nothing.
+    """
+    if not isinstance(profile, UsageProfile):
+        profile = UsageProfile.load(profile)
+    variants = (
+        (shortcode, morph, tone, level)
+        for shortcode, morph, tone in profile.variants()
+        if has_variant(shortcode, morph, tone)
+    )
+    return Preload(itertools.islice(variants, limit))
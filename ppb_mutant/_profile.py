@@ -0,0 +1,165 @@
+"""
+Recording which emoji a session draws, so the next one can load them up front.
+"""
+import threading
+import time
+
+#: The profile being recorded into, if any. Use record_usage()/stop_recording().
+recording = None
+
+HEADER = '#ppb_mutant usage 1'
+
+
+class UsageProfile:
+    """
+    The emoji variants drawn over one or more sessions, with how many sessions
+    drew each and how soon (in seconds from the start of the session) any of
+    them first did.
+
+    Profiles of separate runs are combined with merge(), so keep one file and
+    merge each session into it.
+    """
+    def __init__(self):
+        self.sessions = 0
+        self._entries = {}  # (shortcode, morph, tone): [sessions, first use or None]
+        self._seen = set()  # Keys noted in the session being recorded
+        self._lock = threading.Lock()
+        self._start = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, variant):
+        return tuple(variant) in self._entries
+
+    def __repr__(self):
+        return f"<{type(self).__name__} variants={len(self)} sessions={self.sessions}>"
+
+    def note(self, shortcode, morph, tone):
+        """
+        Records that a variant was drawn in this session. Only the first time
+        each session counts.
+        """
+        key = shortcode, morph, tone
+        if key in self._seen:
+            return
+        at = None if self._start is None else time.monotonic() - self._start
+        with self._lock:
+            if key in self._seen:
+                return
+            self._seen.add(key)
+            entry = self._entries.get(key)
+            if entry is None:
+                self._entries[key] = [1, at]
+            else:
+                entry[0] += 1
+                if entry[1] is None or (at is not None and at < entry[1]):
+                    entry[1] = at
+
+    def merge(self, other):
+        """
+        Adds another profile's sessions into this one.
+        """
+        with self._lock:
+            self.sessions += other.sessions
+            for key, (sessions, first) in list(other._entries.items()):
+                entry = self._entries.get(key)
+                if entry is None:
+                    self._entries[key] = [sessions, first]
+                else:
+                    entry[0] += sessions
+                    if entry[1] is None or (first is not None and first < entry[1]):
+                        entry[1] = first
+        return self
+
+    def variants(self, limit=None):
+        """
+        The recorded (shortcode, morph, tone), most wanted first: drawn in the
+        most sessions, then drawn soonest.
+        """
+        rv = sorted(
+            self._entries.items(),
+            key=lambda item: (-item[1][0], item[1][1] is None, item[1][1] or 0, item[0][0]),
+        )
+        return [key for key, _ in rv[:limit]]
+
+    def dump(self, file):
+        """
+        Writes the profile to a text file object.
+
+        One variant per line, tab separated: shortcode, morph (empty for None),
+        tone (empty for the default), sessions, and first use in milliseconds
+        (empty if not timed).
+        """
+        file.write(f"{HEADER}\t{self.sessions}\n")
+        for key in self.variants():
+            shortcode, morph, tone = key
+            sessions, first = self._entries[key]
+            first = '' if first is None else round(first * 1000)
+            file.write(f"{shortcode}\t{morph or ''}\t{tone or ''}\t{sessions}\t{first}\n")
+
+    def save(self, path):
+        """
+        Writes the profile to path, replacing it.
+        """
+        with open(path, 'wt', encoding='utf-8') as file:
+            self.dump(file)
+
+    @classmethod
+    def parse(cls, file):
+        """
+        Reads a profile written by dump().
+        """
+        rv = cls()
+        header = file.readline().rstrip('\n').split('\t')
+        if header[0] != HEADER:
+            raise ValueError(f"Not a usage profile (header {header[0]!r})")
+        rv.sessions = int(header[1])
+        for line in file:
+            line = line.rstrip('\n')
+            if line:
+                shortcode, morph, tone, sessions, first = line.split('\t')
+                rv._entries[shortcode, morph or None, tone or None] = [
+                    int(sessions), int(first) / 1000 if first else None,
+                ]
+        return rv
+
+    @classmethod
+    def load(cls, path):
+        """
+        Reads a profile from path. A missing file is an empty profile, as on
+        the first run.
+        """
+        try:
+            with open(path, 'rt', encoding='utf-8') as file:
+                return cls.parse(file)
+        except FileNotFoundError:
+            return cls()
+
+
+def record_usage(profile=None, *, timestamps=True):
+    """
+    Starts recording every emoji variant drawn into profile (a new one if not
+    given) as one session, and returns it.
+
+    timestamps records how long after this call each variant was first drawn,
+    to load the early ones first.
+    """
+    global recording
+    if profile is None:
+        profile = UsageProfile()
+    with profile._lock:
+        profile.sessions += 1
+        profile._seen = set()
+    profile._start = time.monotonic() if timestamps else None
+    recording = profile
+    return profile
+
+
+def stop_recording():
+    """
+    Stops recording, and returns the profile that was being recorded (or None).
+    """
+    global recording
+    profile, recording = recording, None
+    return profile
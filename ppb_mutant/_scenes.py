@@ -0,0 +1,254 @@
+"""
+The morph/tone picker scene.
+"""
+import collections
+import weakref
+
+import ppb
+
+from . import TONES_ALL, TONES_HMN, TONES_PAW, TONES_CLW
+from ._data import is_valid_morph_tone, has_variant
+from ._emoji import Emoji, MorphToneGroup
+from ._hittest import HitTestMixin
+
+
+#: The parts of the camera frame the layout depends on
+Frame = collections.namedtuple('Frame', 'left right height')
+
+
+class _Layout:
+    """
+    The sprites for one scene layout, kept for the next scene opened.
+
+    The sample sprites show the owning scene's MorphToneGroup, and nothing in
+    between, so a closed scene's group isn't kept alive.
+    """
+    def __init__(self, sprites):
+        self.sprites = sprites  # [(sprite, tag)]
+        self._samples = [(sprite, sprite.image.shortcode) for sprite, tag in sprites if tag == 'sample']
+        self._owner = None
+
+    def claim(self, scene):
+        """
+        Hands the sprites to scene, rebinding the samples to its group, unless
+        another live scene has them.
+        """
+        owner = self._owner and self._owner()
+        if owner is not None and owner is not scene:
+            return False
+        self._owner = weakref.ref(scene, self._unbind)
+        for sprite, shortcode in self._samples:
+            sprite.image = scene.mtg(shortcode)
+        return True
+
+    def _unbind(self, ref=None):
+        for sprite, _ in self._samples:
+            sprite.image = None
+
+
+#: How many layouts are kept for scenes opened later, least recently used go
+#: first
+MAX_LAYOUTS = 8
+
+_layouts = collections.OrderedDict()  # (scene class, Frame, include_hoof, Sprite): _Layout
+
+
+def _keep_layout(key, layout):
+    _layouts[key] = layout
+    _layouts.move_to_end(key)
+    while len(_layouts) > MAX_LAYOUTS:
+        _layouts.popitem(last=False)
+
+
+def _frange(x, y, jump):
+    if jump > 0:
+        while x <= y:
+            yield x
+            x += jump
+    else:
+        while x >= y:
+            yield x
+            x += jump
+
+
+class SelectScene(HitTestMixin, ppb.BaseScene):
+    """
+    A base scene to provide mutant hand/character customization.
+
+    Subclass and override do_morphtone().
+
+    * morph: The current morph
+    * tone: The current color tone
+    * do_morphtone(): Called whenever the morph or tone changes
+
+    SelectScene.Sprite can be overriden to change the sprite.
+
+    The sprites are made once per scene class, frame size, include_hoof and
+    Sprite, and reused by the next scene opened like that, rebound to its
+    MorphToneGroup. Call precompute() ahead of time (eg, while loading) to make
+    them up front.
+    """
+
+    #: Hoof hands have incomplete emoji coverage, so games may choose to opt-out of it.
+    include_hoof = True
+
+    hit_test_tags = ('morph', 'tone')
+
+    class Sprite(ppb.BaseSprite):
+        """
+        The sprite to use in the menu
+        """
+
+    def __init__(self, *p, morph='hmn', tone=None, mtg=None, **kw):
+        if mtg is None:
+            mtg = MorphToneGroup(morph=morph, tone=tone)
+        super().__init__(*p, mtg=mtg, **kw)
+
+        self.main_camera.position = ppb.Vector(
+            0,
+            -self.main_camera.half_height + 2,
+        )
+
+        cam = self.main_camera
+        self._frame = Frame(cam.frame_left, cam.frame_right, cam.frame_height)
+        for sprite, tag in self._layout():
+            self.add(sprite, tags=[tag])
+
+        # ymin = min(s.bottom - 0.5 for s in self)
+        # ymax = max(s.top + 0.5 for s in self)
+
+    def _layout_key(self):
+        # Everything the sprites depend on, other than the mtg they're rebound to
+        return type(self), self._frame, self.include_hoof, self.Sprite
+
+    def _layout(self):
+        key = self._layout_key()
+        layout = _layouts.get(key)
+        if layout is None:
+            layout = _Layout(self._build())
+        _keep_layout(key, layout)
+        if not layout.claim(self):
+            # Another picker is open at this size; it keeps the cached sprites
+            return self._build()
+        return layout.sprites
+
+    @classmethod
+    def precompute(cls, frame, **props):
+        """
+        Makes the sprites for a camera frame ahead of time.
+
+        frame is a Frame(left, right, height) in game units, or a
+        (width, height) for a frame centered on x=0, like the scene's camera.
+        props are any attributes the scene will be opened with (eg,
+        include_hoof), so the sprites match it.
+
+        The sprites are made without a scene, so _get_*() overrides should use
+        self._frame rather than self.main_camera to be precomputed.
+        """
+        if not isinstance(frame, Frame):
+            width, height = frame
+            frame = Frame(-width / 2, width / 2, height)
+        prototype = cls.__new__(cls)
+        vars(prototype).update(props, _frame=frame, mtg=MorphToneGroup())
+        layout = _Layout(prototype._build())
+        layout._unbind()
+        _keep_layout(prototype._layout_key(), layout)
+        return layout
+
+    def _build(self):
+        return [
+            *((s, 'sample') for s in self._get_samples()),
+            *((s, 'morph') for s in self._get_morphs()),
+            *((s, 'tone') for s in self._get_tones()),
+        ]
+
+    def _get_samples(self):
+        left = self._frame.left
+        yield self.Sprite(image=self.mtg('hand'), pos=(left + 0.5, 1.5))
+        yield self.Sprite(image=self.mtg('raising_hand'), pos=(left + 1.5, 1.5))
+
+    def _get_morphs(self):
+        right = self._frame.right
+        yield self.Sprite(image=Emoji('hand', morph='clw', tone=None), pos=(right - 0.5, 1.5))
+        yield self.Sprite(image=Emoji('hand', morph='hmn', tone=None), pos=(right - 1.5, 1.5))
+        yield self.Sprite(image=Emoji('hand', morph='paw', tone=None), pos=(right - 2.5, 1.5))
+        if self.include_hoof and has_variant('hand', morph='hoof'):
+            yield self.Sprite(image=Emoji('hand', morph='hoof', tone=None), pos=(right - 3.5, 1.5))
+
+    def _grid(self):
+        frame = self._frame
+        for y in _frange(-1, -int(frame.height - 2) + 0.5, -1.0):
+            for x in _frange(int(frame.left) + 0.5, int(frame.right) - 0.5, 1.0):
+                yield x, y
+
+    def _get_tones(self):
+        left = self._frame.left
+        right = self._frame.right
+
+        # TONES_HMN
+        yield self.Sprite(image=Emoji('hand', morph='hmn', tone='h1'), pos=(left + 0.5, 0))
+        yield self.Sprite(image=Emoji('hand', morph='hmn', tone='h2'), pos=(left + 1.5, 0))
+        yield self.Sprite(image=Emoji('hand', morph='hmn', tone='h3'), pos=(left + 2.5, 0))
+        yield self.Sprite(image=Emoji('hand', morph='hmn', tone='h4'), pos=(left + 3.5, 0))
+        yield self.Sprite(image=Emoji('hand', morph='hmn', tone='h5'), pos=(left + 4.5, 0))
+
+        # Default tone
+        # yield self.Sprite(image=Emoji('cross'), pos=((left + 4.5 + right - 2.5) / 2, 0))
+        yield self.Sprite(image=Emoji('cross'), pos=(0, 0))
+
+        # TONES_PAW
+        yield self.Sprite(image=Emoji('hand', morph='paw', tone='fk1'), pos=(right - 0.5, 0))
+        yield self.Sprite(image=Emoji('hand', morph='paw', tone='ft1'), pos=(right - 1.5, 0))
+        yield self.Sprite(image=Emoji('hand', morph='paw', tone='fe1'), pos=(right - 2.5, 0))
+
+        # TONES_ALL
+        tones = (t for t in TONES_ALL if t is not None)
+        for tone, pos in zip(tones, self._grid()):
+            yield self.Sprite(image=Emoji('color_modifier', tone=tone), pos=pos)
+
+    @property
+    def morph(self):
+        """
+        The currently selected morph
+        """
+        return self.mtg.morph
+
+    @morph.setter
+    def morph(self, value):
+        self.mtg.set_morphtone(value, self.mtg.tone, callback=self.do_update_morphtone)
+
+    @property
+    def tone(self):
+        """
+        The currently selected tone
+        """
+        return self.mtg.tone
+
+    @tone.setter
+    def tone(self, value):
+        self.mtg.set_morphtone(self.mtg.morph, value, callback=self.do_update_morphtone)
+
+    def on_button_pressed(self, mouse, signal):
+        sprite = self.hit_grid.at(mouse.position, tag='morph')
+        if sprite is not None:
+            if not is_valid_morph_tone(sprite.image.morph, self.tone):
+                self.tone = None
+            self.morph = sprite.image.morph
+            return
+
+        sprite = self.hit_grid.at(mouse.position, tag='tone')
+        if sprite is not None:
+            if not is_valid_morph_tone(self.morph, sprite.image.tone):
+                if sprite.image.tone in TONES_PAW:
+                    self.morph = 'paw'
+                elif sprite.image.tone in TONES_HMN:
+                    self.morph = 'hmn'
+                elif sprite.image.tone in TONES_CLW:
+                    self.morph = 'clw'
+            self.tone = sprite.image.tone
+            return
+
+    def do_update_morphtone(self):
+        """
+        Called whenever the morph or tone is updated. Override with your own class.
+        """
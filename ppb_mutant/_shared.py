@@ -0,0 +1,286 @@
+"""
+Decoded emoji pixels shared between processes on the same host.
+
+The segment is laid out like the packed assets container, but is written to
+while in use:
+
+* header: MAGIC, then the slot capacity, segment size, bytes used and entry
+  count (HEADER)
+* an open-addressed hash table of entries by name (ENTRY), probed linearly
+  from crc32(name); an offset of 0 is an unused slot
+* the data: for each entry, its UTF-8 name then its RGBA32 pixels, each aligned
+  to DATA_ALIGN
+
+An entry's name is the build of the assets (see build_id()), a NUL, then the
+asset name, so processes running different builds never share an image.
+
+Entries are never changed or removed once published, and are only published
+after their pixels are written, so readers never see a half written image. A
+lock file (flock) serializes writers and guards the table; the OS drops it if
+its holder dies, which at worst leaks the space that was being written.
+"""
+import contextlib
+import ctypes
+import os
+import struct
+import sys
+import tempfile
+import threading
+
+from sdl2 import (
+    SDL_ConvertSurfaceFormat, SDL_CreateRGBSurfaceWithFormatFrom,
+    SDL_FreeSurface, SDL_SetSurfaceBlendMode, SDL_PIXELFORMAT_RGBA32,
+    SDL_BLENDMODE_BLEND,
+)
+from ppb.systems.sdl_utils import sdl_call
+
+from . import stats
+from ._binindex import slot_of
+from ._data import build_id
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+MAGIC = b'MTNTSHM1'
+HEADER = struct.Struct('<8s4I')
+ENTRY = struct.Struct('<2I2H')  # offset, name length, width, height
+DATA_ALIGN = 16
+
+#: The SharedPixels Emoji load through, if any. Use share_pixels()/stop_sharing().
+active = None
+
+# Every segment opened, so none are unmapped while surfaces point into them
+_mapped = []
+
+
+def _align(offset):
+    return -(-offset // DATA_ALIGN) * DATA_ALIGN
+
+
+def _open_segment(name, size):
+    """
+    Creates the named segment, or attaches to it if it exists.
+
+    The segment outlives this process, so it isn't left to multiprocessing's
+    resource tracker, which would remove it from under the others on exit.
+    """
+    from multiprocessing import resource_tracker, shared_memory
+    try:
+        segment = shared_memory.SharedMemory(name, create=True, size=size)
+    except FileExistsError:
+        segment = shared_memory.SharedMemory(name)
+    try:
+        resource_tracker.unregister(segment._name, 'shared_memory')
+    except Exception:
+        pass
+    return segment
+
+
+class SharedPixels:
+    """
+    A named shared memory segment of decoded emoji pixels, RGBA32.
+
+    The first process to open a name creates the segment (size bytes, room for
+    slots images); the rest attach to it. Images are added until it's full,
+    after which loads just decode privately.
+
+    Surfaces made from it point into the segment instead of copying, so it's
+    never unmapped; the segment itself lasts until unlink() or a reboot.
+
+    Images are shared by asset name within a build of the assets (build, by
+    default this one's build_id()), so processes with older or newer assets
+    only share with their own kind.
+
+    Needs flock, so POSIX only, and Python 3.8's multiprocessing.shared_memory.
+    """
+    def __init__(self, name='ppb_mutant', *, size=256 * 1024 * 1024, slots=16384, build=None):
+        if fcntl is None:
+            raise RuntimeError("Sharing pixels needs fcntl.flock, which this platform lacks")
+        if sys.version_info < (3, 8):
+            raise RuntimeError("Sharing pixels needs multiprocessing.shared_memory (Python 3.8)")
+        if slots & (slots - 1):
+            raise ValueError(f"slots must be a power of two, not {slots}")
+        self.name = name
+        self.build = build_id() if build is None else build
+        self._thread_lock = threading.Lock()
+        self._lockfile = open(os.path.join(tempfile.gettempdir(), f"{name}.lock"), 'a+b')
+        with self._locked(fcntl.LOCK_EX):
+            self._segment = _open_segment(name, size)
+            _mapped.append(self._segment)
+            self._buf = self._segment.buf
+            magic, self._capacity = HEADER.unpack_from(self._buf, 0)[:2]
+            if magic == bytes(len(MAGIC)):
+                # New, or its creator died before setting it up
+                self._capacity = slots
+                data_at = _align(HEADER.size + slots * ENTRY.size)
+                HEADER.pack_into(self._buf, 0, MAGIC, slots, self._segment.size, data_at, 0)
+            elif magic != MAGIC:
+                raise ValueError(f"Shared memory {name!r} isn't shared pixels (magic {magic!r})")
+        self._table_at = HEADER.size
+        self._address = ctypes.addressof(ctypes.c_char.from_buffer(self._buf))
+
+    def __repr__(self):
+        return f"<{type(self).__name__} name={self.name!r}>"
+
+    @contextlib.contextmanager
+    def _locked(self, operation):
+        # flock is per open file, so threads need their own lock too
+        with self._thread_lock:
+            fcntl.flock(self._lockfile, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lockfile, fcntl.LOCK_UN)
+
+    def _entry_name(self, key):
+        return f"{self.build}\0{key}"
+
+    def _find(self, key):
+        # Returns (slot, entry); entry is None if key isn't there
+        name = self._entry_name(key)
+        slot = slot_of(name, self._capacity)
+        encoded = name.encode('utf-8')
+        for _ in range(self._capacity):
+            entry = ENTRY.unpack_from(self._buf, self._table_at + slot * ENTRY.size)
+            offset, namelen = entry[:2]
+            if not offset:
+                return slot, None
+            if namelen == len(encoded) and self._buf[offset:offset + namelen] == encoded:
+                return slot, entry
+            slot = (slot + 1) & (self._capacity - 1)
+        return None, None
+
+    def _surface(self, entry):
+        offset, namelen, width, height = entry
+        return sdl_call(
+            SDL_CreateRGBSurfaceWithFormatFrom,
+            self._address + _align(offset + namelen), width, height, 32, width * 4,
+            SDL_PIXELFORMAT_RGBA32,
+            _check_error=lambda rv: not rv
+        )
+
+    def get(self, key):
+        """
+        A surface of the shared pixels for an asset name, or None if they
+        aren't shared (yet).
+        """
+        with self._locked(fcntl.LOCK_SH):
+            _, entry = self._find(key)
+        if entry is None:
+            return None
+        return self._surface(entry)
+
+    def put(self, key, surface):
+        """
+        Shares the pixels of a surface under an asset name, and returns a
+        surface of the shared copy, or None if there's no room. The given
+        surface is left alone.
+        """
+        converted = sdl_call(
+            SDL_ConvertSurfaceFormat, surface, SDL_PIXELFORMAT_RGBA32, 0,
+            _check_error=lambda rv: not rv
+        )
+        try:
+            info = converted.contents
+            row = info.w * 4
+            encoded = self._entry_name(key).encode('utf-8')
+            with self._locked(fcntl.LOCK_EX):
+                slot, entry = self._find(key)
+                if entry is None:
+                    magic, capacity, size, used, count = HEADER.unpack_from(self._buf, 0)
+                    pixels_at = _align(used + len(encoded))
+                    end = _align(pixels_at + row * info.h)
+                    if slot is None or end > size or count + 1 > capacity // 2:
+                        if stats.enabled:
+                            stats.count('shared.full')
+                        return None
+                    self._buf[used:used + len(encoded)] = encoded
+                    for y in range(info.h):
+                        ctypes.memmove(
+                            self._address + pixels_at + y * row,
+                            info.pixels + y * info.pitch, row,
+                        )
+                    # Publish only once the pixels are there
+                    entry = used, len(encoded), info.w, info.h
+                    HEADER.pack_into(self._buf, 0, magic, capacity, size, end, count + 1)
+                    ENTRY.pack_into(self._buf, self._table_at + slot * ENTRY.size, *entry)
+        finally:
+            SDL_FreeSurface(converted)
+        return self._surface(entry)
+
+    def load(self, key, decode):
+        """
+        A surface for an asset name: the shared pixels if another process (or
+        this one) already decoded it, otherwise decode() shared for next time.
+        Nothing is shared if decode() raises.
+
+        Called in the background thread.
+        """
+        surface = self.get(key)
+        if surface is not None:
+            if stats.enabled:
+                stats.count('shared.hits')
+        else:
+            if stats.enabled:
+                stats.count('shared.misses')
+            decoded = decode()
+            shared = self.put(key, decoded)
+            if shared is None:
+                surface = decoded
+            else:
+                SDL_FreeSurface(decoded)
+                surface = shared
+        sdl_call(
+            SDL_SetSurfaceBlendMode, surface, SDL_BLENDMODE_BLEND,
+            _check_error=lambda rv: rv < 0
+        )
+        return surface
+
+    def usage(self):
+        """
+        {bytes, size, count, slots}, as plain data.
+        """
+        with self._locked(fcntl.LOCK_SH):
+            _, capacity, size, used, count = HEADER.unpack_from(self._buf, 0)
+        return {
+            'bytes': used,
+            'size': size,
+            'count': count,
+            'slots': capacity,
+        }
+
+    def unlink(self):
+        """
+        Removes the segment's name, so the next process to open it starts a new
+        one. Processes attached to it keep using it.
+        """
+        # Not SharedMemory.unlink(): that also unregisters the segment from the
+        # resource tracker, which _open_segment() already did
+        import _posixshmem
+        with self._locked(fcntl.LOCK_EX):
+            try:
+                _posixshmem.shm_unlink(self._segment._name)
+            except FileNotFoundError:
+                pass
+
+
+def share_pixels(name='ppb_mutant', **kwargs):
+    """
+    Loads every Emoji through the named SharedPixels from now on (see
+    SharedPixels for the arguments), and returns it.
+
+    Every process using the same name shares decoded images.
+    """
+    global active
+    active = SharedPixels(name, **kwargs)
+    return active
+
+
+def stop_sharing():
+    """
+    Goes back to decoding privately. Images already loaded stay shared.
+    """
+    global active
+    active = None
@@ -0,0 +1,155 @@
+"""
+Laying out `:shortcode:` text as a single image.
+"""
+import functools
+import re
+
+from sdl2 import (
+    SDL_Rect, SDL_BlitScaled, SDL_CreateRGBSurfaceWithFormat, SDL_FreeSurface,
+    SDL_SetSurfaceBlendMode, SDL_PIXELFORMAT_RGBA32, SDL_BLENDMODE_BLEND,
+)
+from ppb.assetlib import AbstractAsset, ChainingMixin, FreeingMixin
+from ppb.systems.sdl_utils import sdl_call
+
+from ._data import _has_index, lookup_alias, lookup_shortcode, pick_level
+from ._emoji import variant_cache
+from ._memory import texture_memory
+
+# The closing colon is only looked ahead at, so a candidate that isn't an emoji
+# leaves it to open the next one (like the second colon of 'ratio 3:2:thinking:')
+SHORTCODE = re.compile(r':([A-Za-z0-9_+-]+)(?=:)')
+
+#: Gap left for a space, in emoji widths
+SPACE = 0.25
+
+
+def _known(shortcode):
+    return (
+        not _has_index()
+        or lookup_alias(shortcode) is not None
+        or lookup_shortcode(shortcode) is not None
+    )
+
+
+def parse_shortcodes(text):
+    """
+    Splits text into runs of plain text (str) and emoji (a 1-tuple of the
+    shortcode or alias).
+
+    Anything between colons that isn't in the index stays text.
+    """
+    rv = []
+    last = 0
+    for match in SHORTCODE.finditer(text):
+        if match.start() < last or not _known(match.group(1)):
+            # Opened by the closing colon of an emoji, or not an emoji
+            continue
+        if match.start() > last:
+            rv.append(text[last:match.start()])
+        rv.append((match.group(1),))
+        last = match.end() + 1
+    if last < len(text):
+        rv.append(text[last:])
+    return rv
+
+
+def layout_text(text, *, space=SPACE):
+    """
+    Lays a line out left to right, in emoji widths.
+
+    Returns ([(shortcode, x), ...], width). Spaces leave a gap of space each;
+    other text isn't drawn (use ppb's text support for that), and takes no room.
+    """
+    placed = []
+    x = 0.0
+    for run in parse_shortcodes(text):
+        if isinstance(run, tuple):
+            placed.append((run[0], x))
+            x += 1
+        else:
+            x += space * sum(char.isspace() for char in run)
+    return placed, x
+
+
+class EmojiText(ChainingMixin, FreeingMixin, AbstractAsset):
+    """
+    A line of `:shortcode:` text drawn into one image, pixels high.
+
+    Full variant shortcodes (like :hand_paw_r1:) keep their own morph/tone;
+    aliases use the given one.
+
+    Use render_text() to get these; it caches them.
+
+    The emoji are taken from variant_cache, and held until this is collected.
+    """
+    def __init__(self, text, *, morph='hmn', tone=None, pixels=64, space=SPACE):
+        self.text = text
+        self.morph = morph
+        self.tone = tone
+        self.pixels = pixels
+        placed, self.width = layout_text(text, space=space)
+        level = pick_level(pixels)
+        images = {}
+        self._placed = []
+        for shortcode, x in placed:
+            emoji = variant_cache.acquire(shortcode, morph=morph, tone=tone, level=level)
+            if emoji.name in images:
+                variant_cache.release(emoji)
+            images[emoji.name] = emoji
+            self._placed.append((emoji, x))
+        self._emojis = list(images.values())
+        for emoji in self._emojis:
+            # Unloaded emoji have no future to wait on
+            emoji.ensure_started()
+        self._start(*self._emojis)
+
+    def __del__(self):
+        for emoji in getattr(self, '_emojis', ()):
+            variant_cache.release_later(emoji)
+        super().__del__()
+
+    def __repr__(self):
+        return f"<{type(self).__name__} text={self.text!r} morph={self.morph!r} tone={self.tone!r}>"
+
+    def _background(self):
+        # Called in background thread
+        pixels = self.pixels
+        surface = sdl_call(
+            SDL_CreateRGBSurfaceWithFormat, 0, max(round(self.width * pixels), 1), pixels,
+            32, SDL_PIXELFORMAT_RGBA32,
+            _check_error=lambda rv: not rv
+        )
+        for emoji, x in self._placed:
+            # Kept from being unloaded while it's blitted
+            with texture_memory.pinned(emoji):
+                sdl_call(
+                    SDL_BlitScaled, emoji.load(), None, surface,
+                    SDL_Rect(round(x * pixels), 0, pixels, pixels),
+                    _check_error=lambda rv: rv < 0
+                )
+        sdl_call(
+            SDL_SetSurfaceBlendMode, surface, SDL_BLENDMODE_BLEND,
+            _check_error=lambda rv: rv < 0
+        )
+        return surface
+
+    def free(self, object, _SDL_FreeSurface=SDL_FreeSurface):
+        _SDL_FreeSurface(object)
+
+
+@functools.lru_cache(maxsize=256)
+def _render(text, morph, tone, pixels, space):
+    return EmojiText(text, morph=morph, tone=tone, pixels=pixels, space=space)
+
+
+def render_text(text, *, morph='hmn', tone=None, group=None, pixels=64, space=SPACE):
+    """
+    The EmojiText for a line, reusing the last one made for the same text and
+    morph/tone while it's still cached.
+
+    With a MorphToneGroup as group, its current morph/tone are used, so a
+    retoned group gets new images.
+    """
+    if group is not None:
+        morph, tone = group.morph, group.tone
+    return _render(text, morph, tone, pixels, space)
@@ -5,7 +5,7 @@ Show an index of available emoji
 import ppb
 from ppb.features.loadingscene import BaseLoadingScene
 import math
-from ppb_mutant import Emoji, MorphToneGroup, load_index, SelectScene
+from ppb_mutant import Emoji, MorphToneGroup, load_catalog, SelectScene, HitTestMixin
 
 
 class LoadingScene(BaseLoadingScene):
@@ -43,9 +43,9 @@ class EmojiSprite(Region, ppb.BaseSprite):
     def __init__(self, *p, **kw):
         super().__init__(*p, **kw)
 
-    def on_button_pressed(self, mouse, signal):
-        if self.contains(mouse.position):
-            print(self.image.shortcode)
+    def do_click(self, mouse, signal):
+        # Called by IndexScene for the sprite under the mouse only
+        print(self.image.shortcode)
 
 
 class OpenMenuSprite(Region, ppb.BaseSprite):
@@ -62,21 +62,35 @@ class OpenMenuSprite(Region, ppb.BaseSprite):
         self.position = ppb.Vector(cam.frame_left + 0.5, cam.frame_top - 0.5)
 
 
-class IndexScene(ppb.BaseScene):
+class IndexScene(HitTestMixin, ppb.BaseScene):
+    hit_test_tags = ('emoji',)
+    hit_test_cell_size = 1.1
+
+    #: Only make sprites for the cells around the camera, recycling them as it
+    #: pans. Otherwise every emoji gets a sprite up front.
+    virtual = True
+    #: How many cells past the camera's frame to keep sprites for
+    virtual_margin = 1
+
+    scale = 1.1
+
     def __init__(self, *p, **kw):
         super().__init__(*p, pixel_ratio=64, **kw)
 
         self._mtg = MorphToneGroup()
 
-        for s in self.get_options():
-            self.add(s, tags=['emoji'])
+        if self.virtual:
+            self.setup_virtual()
+        else:
+            for s in self.get_options():
+                self.add(s, tags=['emoji'])
 
-        self.add(OpenMenuSprite())
+            self.xmin = min(s.left for s in self.get(tag='emoji'))
+            self.xmax = max(s.right for s in self.get(tag='emoji'))
+            self.ymin = min(s.bottom for s in self.get(tag='emoji'))
+            self.ymax = max(s.top for s in self.get(tag='emoji'))
 
-        self.xmin = min(s.left for s in self.get(tag='emoji'))
-        self.xmax = max(s.right for s in self.get(tag='emoji'))
-        self.ymin = min(s.bottom for s in self.get(tag='emoji'))
-        self.ymax = max(s.top for s in self.get(tag='emoji'))
+        self.add(OpenMenuSprite())
 
         self.main_camera.position = ppb.Vector(
             (self.xmin + self.xmax) / 2,
@@ -89,28 +103,83 @@ class IndexScene(ppb.BaseScene):
                 yield x * scale, y * scale
 
     def compile_emojis(self):
-        # Load the index
-        index = sorted(load_index(), key=lambda v: v[1])
-        # Reduce to aliases, removing duplicates
-        emojis = []
-        for shortcode, path, alias in index:
-            name = alias or shortcode
-            if name not in emojis:
-                emojis.append(name)
-        return emojis
+        # The catalogue is the index reduced to aliases, without duplicates
+        return list(load_catalog())
 
     def get_options(self):
         emojis = self.compile_emojis()
         cols = math.floor(math.sqrt(len(emojis)))
         rows = math.ceil(len(emojis) / cols)
-        for emoji, pos in zip(emojis, self.grid(rows, cols, scale=1.1)):
+        for emoji, pos in zip(emojis, self.grid(rows, cols, scale=self.scale)):
             yield EmojiSprite(image=self._mtg(emoji), pos=pos)
         print(f"Loaded {len(emojis)} emoji")
 
+    def setup_virtual(self):
+        """
+        Lays out the same grid as get_options(), without making any sprites.
+        """
+        self._emojis = self.compile_emojis()
+        self._cols = max(math.floor(math.sqrt(len(self._emojis))), 1)
+        self._rows = math.ceil(len(self._emojis) / self._cols)
+        self._cells = {}  # (col, row): sprite
+
+        # Sprites are 1 unit across, centered on their cell
+        self.xmin = -0.5
+        self.xmax = (self._cols - 1) * self.scale + 0.5
+        self.ymin = -0.5
+        self.ymax = (self._rows - 1) * self.scale + 0.5
+        print(f"Loaded {len(self._emojis)} emoji")
+
+    def _cell_range(self, low, high, count):
+        first = math.floor(low / self.scale) - self.virtual_margin
+        last = math.ceil(high / self.scale) + self.virtual_margin
+        return range(max(first, 0), min(last, count - 1) + 1)
+
+    def update_virtual(self):
+        """
+        Makes sure the cells in view have sprites, moving sprites over from
+        cells that have scrolled out of view.
+        """
+        cam = self.main_camera
+        if not (cam.frame_width and cam.frame_height):
+            return
+
+        wanted = {
+            (col, row)
+            for row in self._cell_range(cam.frame_bottom, cam.frame_top, self._rows)
+            for col in self._cell_range(cam.frame_left, cam.frame_right, self._cols)
+            if row * self._cols + col < len(self._emojis)
+        }
+
+        spare = [
+            self._cells.pop(cell)
+            for cell in list(self._cells)
+            if cell not in wanted
+        ]
+        for col, row in wanted - self._cells.keys():
+            image = self._mtg(self._emojis[row * self._cols + col])
+            pos = ppb.Vector(col * self.scale, row * self.scale)
+            if spare:
+                sprite = spare.pop()
+                sprite.image = image
+                sprite.position = pos
+                self.hit_grid.move(sprite)
+            else:
+                sprite = EmojiSprite(image=image, pos=pos)
+                self.add(sprite, tags=['emoji'])
+            self._cells[col, row] = sprite
+
+        # Zoomed in, so fewer cells are showing
+        for sprite in spare:
+            self.remove(sprite)
+
     frame_happened = False
 
     def on_pre_render(self, event, signal):
         self.frame_happened = True
+        self._mtg.fit(self.main_camera.pixel_ratio)
+        if self.virtual:
+            self.update_virtual()
 
     def on_mouse_motion(self, mouse, signal):
         if not self.frame_happened:
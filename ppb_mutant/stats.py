@@ -0,0 +1,199 @@
+"""
+Opt-in instrumentation for emoji resolution, caching and reloads.
+
+Off by default, and cheap while off: instrumented code checks `enabled` before
+doing anything else.
+
+    from ppb_mutant import stats
+    stats.enable()
+    ...
+    print(stats.snapshot())
+
+Hooks added with add_hook() are called as hook(name, value) for every count
+(value is the increment) and timing (value is seconds), for forwarding to
+telemetry.
+"""
+import bisect
+import collections
+import functools
+import sys
+import time
+import weakref
+
+__all__ = (
+    'enable', 'disable', 'reset', 'snapshot', 'add_hook', 'remove_hook',
+    'Histogram',
+)
+
+#: Whether stats are being collected. Use enable()/disable().
+enabled = False
+
+_counters = collections.Counter()
+_timings = {}
+_hooks = []
+_groups = weakref.WeakSet()
+
+
+class Histogram:
+    """
+    Timing histogram with fixed buckets, in seconds.
+    """
+    #: Upper bounds of the buckets; the last bucket is everything bigger
+    BOUNDS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+    def __init__(self):
+        self.buckets = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, seconds):
+        self.buckets[bisect.bisect_left(self.BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = seconds if self.max is None else max(self.max, seconds)
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'total': self.total,
+            'min': self.min,
+            'max': self.max,
+            'buckets': dict(zip([*map(str, self.BOUNDS), 'inf'], self.buckets)),
+        }
+
+
+def enable():
+    """
+    Start collecting.
+    """
+    global enabled
+    enabled = True
+
+
+def disable():
+    """
+    Stop collecting. What's been collected so far is kept.
+    """
+    global enabled
+    enabled = False
+
+
+def reset():
+    """
+    Throw away everything collected so far.
+    """
+    _counters.clear()
+    _timings.clear()
+
+
+def add_hook(hook):
+    """
+    Call hook(name, value) for every count and timing while enabled.
+    """
+    _hooks.append(hook)
+
+
+def remove_hook(hook):
+    _hooks.remove(hook)
+
+
+def count(name, increment=1):
+    """
+    Bump a counter. Callers check `enabled` first.
+    """
+    _counters[name] += increment
+    for hook in _hooks:
+        hook(name, increment)
+
+
+def record(name, seconds):
+    """
+    Add a timing. Callers check `enabled` first.
+    """
+    try:
+        histogram = _timings[name]
+    except KeyError:
+        histogram = _timings[name] = Histogram()
+    histogram.add(seconds)
+    for hook in _hooks:
+        hook(name, seconds)
+
+
+def timed(name):
+    """
+    Decorator recording how long each call takes, while enabled.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def track_group(group):
+    """
+    Remember a MorphToneGroup for snapshot(), without keeping it alive.
+    """
+    _groups.add(group)
+
+
+def _cache_info():
+    # Only report on what's been imported; snapshot() shouldn't import ppb
+    rv = {}
+    data = sys.modules.get('ppb_mutant._data')
+    if data is not None:
+        for name in ('load_index', 'load_aliases', '_resolve_stem', '_resolve_name', 'stored_name', 'has_variant'):
+            rv[name] = getattr(data, name).cache_info()._asdict()
+    memory = sys.modules.get('ppb_mutant._memory')
+    if memory is not None:
+        rv['textures'] = memory.texture_memory.usage()
+    shared = sys.modules.get('ppb_mutant._shared')
+    if shared is not None and shared.active is not None:
+        rv['shared_pixels'] = shared.active.usage()
+    emoji = sys.modules.get('ppb_mutant._emoji')
+    if emoji is not None:
+        cache = emoji.variant_cache
+        rv['variant_cache'] = {
+            'referenced': cache.referenced,
+            'idle': cache.idle,
+            'max_idle': cache.max_idle,
+        }
+    return rv
+
+
+def snapshot():
+    """
+    Everything collected so far, as plain data:
+
+    * counters: {name: count}
+    * timings: {name: histogram}
+    * caches: {function: lru_cache statistics}, plus the variant cache's size,
+      decoded texture memory against its budget and shared pixels in use
+      (collected even when disabled)
+    * groups: [{morph, tone, level, live_proxies}] for every live MorphToneGroup
+    """
+    return {
+        'enabled': enabled,
+        'counters': dict(_counters),
+        'timings': {name: histogram.as_dict() for name, histogram in _timings.items()},
+        'caches': _cache_info(),
+        'groups': [
+            {
+                'morph': group.morph,
+                'tone': group.tone,
+                'level': group.level,
+                'live_proxies': len(group._emoji),
+            }
+            for group in list(_groups)
+        ],
+    }
@@ -10,7 +10,8 @@ setup(
     name='ppb-mutant',
     version='0.11.2',
     packages=['ppb_mutant', 'ppb_mutant._assets'],
-    package_data={'ppb_mutant._assets': ['*.png', '*.txt']},
+    package_data={'ppb_mutant._assets': ['*.png', '*.txt', '*.bin', '*.pack']},
+    python_requires='>=3.7',
     install_requires=[
         'ppb>=0.12.0',
     ],